@@ -12,6 +12,14 @@ class BuyProfitAnalyzer:
         """
         Evaluate all buy prices in the database to find profitable buying opportunities.
         """
+        # Analyze market health and rank items based on profit potential
+        return analyze_market_health(self.session, self.server_id, self.profitable_buys(), "buy")
+
+    def profitable_buys(self):
+        """
+        Returns the buy and relist candidates of the server with their prices and profit
+        margin, by item_id, before market health ranking.
+        """
         # Get items with profitable buy prices
         profitable_items_list = cpo.get_profitable_buy_items(self.session, self.server_id)
 
@@ -42,8 +50,5 @@ class BuyProfitAnalyzer:
 
             profitability_info[item_id] = item_data
 
-        # Analyze market health and rank items based on profit potential
-        ranked_profitable_items = analyze_market_health(self.session, self.server_id, profitability_info, "buy")
-
-        return ranked_profitable_items
+        return profitability_info
 
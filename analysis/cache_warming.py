@@ -0,0 +1,101 @@
+#analysis/cache_warming.py
+
+from collections import defaultdict
+import time
+from database.models import CraftingRecipe, CurrentPrice, RecipeReagent, item_itemtype_association
+import database.operations.current_price_operations as cpo
+from database.operations.cache_operations import prefetch_price_data
+from config.cache_config import WARM_CACHE_BATCH_SIZE, WARM_CACHE_MAX_ITEMS
+
+
+def estimate_recipe_profits(session, server_id):
+    """
+    Estimates the profit potential (availability * profit per unit) of every recipe output
+    with a current price, as if every reagent were bought at its current market price.
+    Crafting the reagents instead can only lower the cost, so this errs on the low side of
+    what CraftingProfitAnalyzer finds, but only takes a few bulk queries.
+
+    Returns:
+    - Dictionary of item_id to its estimated profit potential, -inf when a reagent has no price
+    """
+    prices = {
+        item_id: (price, availability)
+        for item_id, price, availability in session.query(
+            CurrentPrice.item_id, CurrentPrice.price, CurrentPrice.availability
+        ).filter(CurrentPrice.server_id == server_id)
+    }
+
+    cheapest_of_type = {}
+    for item_type_id, item_id in session.query(item_itemtype_association.c.item_type_id,
+                                               item_itemtype_association.c.item_id):
+        if item_id in prices:
+            price = prices[item_id][0]
+            cheapest_of_type[item_type_id] = min(price, cheapest_of_type.get(item_type_id, float('inf')))
+
+    reagent_costs = defaultdict(float)
+    for recipe_id, reagent_item_id, reagent_item_type_id, quantity in session.query(
+        RecipeReagent.recipe_id, RecipeReagent.reagent_item_id,
+        RecipeReagent.reagent_item_type_id, RecipeReagent.quantity_required
+    ):
+        if reagent_item_id:
+            price = prices[reagent_item_id][0] if reagent_item_id in prices else float('inf')
+        else:
+            price = cheapest_of_type.get(reagent_item_type_id, float('inf'))
+        reagent_costs[recipe_id] += price * quantity
+
+    estimates = {}
+    for recipe_id, item_id, quantity_produced in session.query(
+        CraftingRecipe.recipe_id, CraftingRecipe.result_item_id, CraftingRecipe.quantity_produced
+    ):
+        if item_id not in prices:
+            continue
+        price, availability = prices[item_id]
+        unit_cost = reagent_costs[recipe_id] / quantity_produced if quantity_produced else reagent_costs[recipe_id]
+        estimate = availability * (price - unit_cost) if unit_cost != float('inf') else float('-inf')
+        estimates[item_id] = max(estimate, estimates.get(item_id, float('-inf')))
+    return estimates
+
+
+def select_warm_up_items(session, server_id, max_items=WARM_CACHE_MAX_ITEMS):
+    """
+    Returns the items the crafting and buy analyzers will look price histories up for,
+    the most profitable first: every recipe output, by estimated profit potential, and
+    every flip candidate of get_profitable_buy_items, by potential profit.
+    """
+    priorities = estimate_recipe_profits(session, server_id)
+    for item_data in cpo.get_profitable_buy_items(session, server_id):
+        potential_profit = item_data['potential_profit'] or 0
+        priorities[item_data['item_id']] = max(potential_profit, priorities.get(item_data['item_id'], float('-inf')))
+
+    ranked = sorted(priorities, key=priorities.get, reverse=True)
+    return ranked[:max_items] if max_items else ranked
+
+
+def warm_cache(session, server_id, max_items=WARM_CACHE_MAX_ITEMS, batch_size=WARM_CACHE_BATCH_SIZE, callback=None):
+    """
+    Prefetches the price histories of select_warm_up_items in batches, the most profitable
+    first, so the first analysis after a refresh finds them cached.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_id: ID of the server to warm the cache for
+    - max_items: Upper bound on the number of items to warm
+    - batch_size: Items prefetched between two progress reports
+    - callback: Called with a progress message after each batch, may raise to stop the warm-up
+
+    Returns:
+    - Dictionary with the number of items selected, already cached, fetched, failed and the elapsed seconds
+    """
+    start_time = time.perf_counter()
+    item_ids = select_warm_up_items(session, server_id, max_items)
+    totals = {"items": len(item_ids), "cached": 0, "fetched": 0, "failed": 0}
+
+    for start in range(0, len(item_ids), batch_size):
+        stats = prefetch_price_data(session, item_ids[start:start + batch_size], server_id)
+        for key in ("cached", "fetched", "failed"):
+            totals[key] += stats[key]
+        if callback:
+            callback(f"Warming price history cache: {min(start + batch_size, len(item_ids))}/{len(item_ids)}")
+
+    totals["elapsed"] = time.perf_counter() - start_time
+    return totals
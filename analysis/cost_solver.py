@@ -0,0 +1,339 @@
+#analysis/cost_solver.py
+
+import numpy as np
+
+# Upper bound on the relaxation rounds of one recipe loop, and the relative change below
+# which a loop's costs count as settled
+LOOP_MAX_ROUNDS = 100
+LOOP_TOLERANCE = 1e-9
+
+
+class CraftingNode:
+    """
+    One item of a CostTable's crafting trees, shared by every tree the item appears in.
+    children holds a (CraftingNode, quantity_required) pair per reagent of the item's
+    chosen recipe, and is empty when the item is bought; on a recipe loop a node is
+    reachable from its own children.
+    """
+
+    __slots__ = ("item_id", "cost", "children")
+
+    def __init__(self, item_id, cost):
+        self.item_id = item_id
+        self.cost = cost
+        self.children = ()
+
+    def materialize(self, path=frozenset()):
+        """
+        Returns the crafting tree below this node as nested {item_id: {'cost', 'quantity',
+        'source', 'children'}} dictionaries, empty when the item is bought. A reagent that
+        is already being crafted further up, on a recipe loop, is shown as bought.
+        """
+        path = path | {self}
+        crafting_tree = {}
+        for node, quantity in self.children:
+            children = node.materialize(path) if node not in path else {}
+            crafting_tree[node.item_id] = {
+                'cost': node.cost,
+                'quantity': quantity,
+                'source': 'crafted' if children else 'market',
+                'children': children
+            }
+        return crafting_tree
+
+
+class CostTable:
+    """
+    The cheapest way for one character to get one unit of every item of a CraftingGraph:
+    cost[item] is the lower of its market price and its cheapest craftable recipe, and
+    recipe_choice[item] is that recipe, or -1 when buying is cheaper. loops lists the
+    recipe loops solved on the way, see solve_loop.
+    """
+
+    def __init__(self, graph, cost, recipe_choice, loops=None):
+        self.graph = graph
+        self.cost = cost
+        self.recipe_choice = recipe_choice
+        self.loops = loops or []
+        self._nodes = {}
+        # Table the nodes of the unchanged items are taken from, and which items those are
+        self._shared_table = None
+        self._shared = None
+
+    def share_nodes(self, previous, affected):
+        """
+        Takes the crafting nodes of the items not affected since the previous table from
+        it, the ones it already built and the ones it builds later. Nodes are always taken
+        from the first table of a chain of incremental solves, so a table keeps at most
+        one other alive.
+        """
+        self._nodes = {item: node for item, node in previous._nodes.items() if not affected[item]}
+        if previous._shared_table is None:
+            self._shared_table, self._shared = previous, ~affected
+        else:
+            self._shared_table, self._shared = previous._shared_table, previous._shared & ~affected
+
+    def crafting_node(self, item):
+        """
+        Returns the CraftingNode of an item. Nodes are built once per item and shared, so
+        the crafting trees of every item of the table form one graph of len(cost) nodes at
+        most; it is snapshotted from the graph's current reagent resolution, and stays valid
+        when the graph's prices are updated afterwards.
+        """
+        node = self._nodes.get(item)
+        if node is not None:
+            return node
+        if self._shared_table is not None and self._shared[item]:
+            node = self._nodes[item] = self._shared_table.crafting_node(item)
+            return node
+
+        graph = self.graph
+        node = self._nodes[item] = CraftingNode(graph.item_ids[item], self.cost[item])
+        recipe = self.recipe_choice[item]
+        if recipe >= 0:
+            resolved = graph.resolve_reagents()
+            node.children = tuple(
+                (self.crafting_node(int(resolved[row])), int(graph.reagent_quantity[row]))
+                for row in graph.reagent_rows(recipe)
+            )
+        return node
+
+    def crafting_tree(self, item):
+        """
+        Returns the crafting tree of an item as nested dictionaries, see CraftingNode.materialize.
+        """
+        return self.crafting_node(item).materialize()
+
+
+def _unit_cost(recipe_rows, quantity_produced, cost):
+    """Cost of one unit from a recipe, given its (reagent, quantity_required) rows."""
+    total_cost = 0.0
+    for reagent, quantity in recipe_rows:
+        total_cost += cost[reagent] * quantity
+    # Adjust for the quantity produced by the recipe
+    return total_cost / quantity_produced if quantity_produced else total_cost
+
+
+def solve_loop(graph, items, cost, recipe_choice, craftable):
+    """
+    Solves the items of one recipe loop together, once every reagent from outside the
+    loop is solved. Starts from the cheapest of the market and the recipes using no item
+    of the loop, then relaxes every recipe of the loop against the current costs, like
+    Bellman-Ford, until no cost drops by more than LOOP_TOLERANCE, for at most
+    LOOP_MAX_ROUNDS rounds. A loop still getting cheaper after that is one where crafting
+    around it yields more than it consumes; its items keep the starting costs.
+
+    Args:
+    - graph: The CraftingGraph of the server
+    - items: Item indices of the loop, see CraftingGraph.recipe_loops
+    - cost, recipe_choice: The costs and choices being solved, updated in place
+    - craftable: Craftable and resolvable flag of every recipe
+
+    Returns:
+    - Dictionary with the item_ids of the loop, the rounds run and whether the costs converged
+    """
+    resolved = graph.resolve_reagents()
+    members = set(items.tolist())
+    recipes = []
+    for item in items.tolist():
+        for recipe in graph.recipes_of(item).tolist():
+            if craftable[recipe]:
+                recipe_rows = [(int(resolved[row]), int(graph.reagent_quantity[row]))
+                               for row in graph.reagent_rows(recipe)]
+                recipes.append((item, recipe, recipe_rows, int(graph.recipe_quantity[recipe])))
+
+    # Starting point: the loop is not used, crafting wins ties with the market
+    for item in members:
+        cheapest_cost = float('inf')
+        cheapest_recipe = -1
+        for result, recipe, recipe_rows, quantity_produced in recipes:
+            if result != item or any(reagent in members for reagent, _ in recipe_rows):
+                continue
+            unit_cost = _unit_cost(recipe_rows, quantity_produced, cost)
+            if unit_cost < cheapest_cost:
+                cheapest_cost = unit_cost
+                cheapest_recipe = recipe
+        if cheapest_recipe >= 0 and cheapest_cost <= cost[item] and cheapest_cost != float('inf'):
+            cost[item] = cheapest_cost
+            recipe_choice[item] = cheapest_recipe
+    start = {item: (cost[item], recipe_choice[item]) for item in members}
+
+    rounds = 0
+    converged = False
+    while rounds < LOOP_MAX_ROUNDS:
+        rounds += 1
+        changed = False
+        for item, recipe, recipe_rows, quantity_produced in recipes:
+            current = cost[item]
+            threshold = current - LOOP_TOLERANCE * abs(current) if current != float('inf') else current
+            unit_cost = _unit_cost(recipe_rows, quantity_produced, cost)
+            if unit_cost < threshold:
+                cost[item] = unit_cost
+                recipe_choice[item] = recipe
+                changed = True
+        if not changed:
+            converged = True
+            break
+
+    if not converged:
+        for item, (item_cost, item_recipe) in start.items():
+            cost[item] = item_cost
+            recipe_choice[item] = item_recipe
+
+    return {"items": [graph.item_ids[item] for item in items.tolist()], "rounds": rounds, "converged": converged}
+
+
+def _starting_costs(graph, previous, affected):
+    """Market prices and no recipe, or the previous costs with only the affected items reset to those."""
+    cost = graph.price.copy()
+    recipe_choice = np.full(graph.item_count, -1, dtype=np.int64)
+    if previous is not None:
+        kept = ~affected
+        cost[kept] = np.asarray(previous.cost)[kept]
+        recipe_choice[kept] = np.asarray(previous.recipe_choice)[kept]
+    return cost, recipe_choice
+
+
+def _previous_loops(graph, previous):
+    """The loop reports of a previous CostTable, keyed by their item indices."""
+    if previous is None:
+        return {}
+    return {tuple(graph.item_index[item_id] for item_id in loop["items"]): loop for loop in previous.loops}
+
+
+def _cost_table(graph, cost, recipe_choice, loops, previous, affected):
+    """The solved CostTable, sharing the crafting nodes of the previous one that are not affected."""
+    table = CostTable(graph, cost, recipe_choice, loops)
+    if previous is not None:
+        table.share_nodes(previous, np.asarray(affected, dtype=bool))
+    return table
+
+
+def solve_costs(graph, craftable, previous=None, affected=None):
+    """
+    Computes the cheapest acquisition cost of every item exactly once, by increasing
+    topological level, so each recipe is costed from reagent costs that are already final.
+    The items of a recipe loop are solved together with solve_loop. Runs in time linear in
+    the number of reagent rows, plus at most LOOP_MAX_ROUNDS passes over each loop.
+
+    Args:
+    - graph: The CraftingGraph of the server
+    - craftable: Boolean array over recipes, see player_operations.CraftabilityIndex
+    - previous: CostTable of the same graph to start from; only the affected items are solved again
+    - affected: Boolean array over items, closed under CraftingGraph.dependent_items, used with previous
+
+    Returns:
+    - The CostTable of the character
+    """
+    cost, recipe_choice = _starting_costs(graph, previous, affected)
+    cost = cost.tolist()
+    recipe_choice = recipe_choice.tolist()
+    previous_loops = _previous_loops(graph, previous)
+    craftable = (craftable & graph.resolvable_recipes()).tolist()
+    resolved = graph.resolve_reagents().tolist()
+    quantity_required = graph.reagent_quantity.tolist()
+    quantity_produced = graph.recipe_quantity.tolist()
+    reagent_offsets = graph.reagent_offsets.tolist()
+    item_recipe_offsets = graph.item_recipe_offsets.tolist()
+    item_recipes = graph.item_recipes.tolist()
+    loops = []
+
+    for group in graph.level_groups():
+        for item in group["items"].tolist():
+            if affected is not None and not affected[item]:
+                continue
+            cheapest_cost = float('inf')
+            cheapest_recipe = -1
+            for recipe in item_recipes[item_recipe_offsets[item]:item_recipe_offsets[item + 1]]:
+                if not craftable[recipe]:
+                    continue
+
+                recipe_rows = [(resolved[row], quantity_required[row])
+                               for row in range(reagent_offsets[recipe], reagent_offsets[recipe + 1])]
+                unit_cost = _unit_cost(recipe_rows, quantity_produced[recipe], cost)
+                if unit_cost < cheapest_cost:
+                    cheapest_cost = unit_cost
+                    cheapest_recipe = recipe
+
+            # Crafting wins ties with the market, like it always did
+            if cheapest_recipe >= 0 and cheapest_cost <= cost[item] and cheapest_cost != float('inf'):
+                cost[item] = cheapest_cost
+                recipe_choice[item] = cheapest_recipe
+
+        for items in group["loops"]:
+            if affected is not None and not affected[items].any():
+                loops.append(previous_loops[tuple(items.tolist())])
+            else:
+                loops.append(solve_loop(graph, items, cost, recipe_choice, craftable))
+
+    return _cost_table(graph, cost, recipe_choice, loops, previous, affected)
+
+
+def _solve_level(graph, group, resolved, craftable, cost, recipe_choice):
+    """Solves the recipes of one level_groups entry in place, see solve_costs_vectorized."""
+    recipes, items, recipe_item = group["recipes"], group["items"], group["recipe_item"]
+    rows, row_recipe = group["rows"], group["row_recipe"]
+    reagents = resolved[rows]
+
+    # Sum of reagent cost * quantity for every recipe of the level
+    with np.errstate(invalid='ignore'):
+        row_costs = cost[reagents] * graph.reagent_quantity[rows]
+    totals = np.bincount(row_recipe, weights=row_costs, minlength=len(recipes))
+
+    quantity_produced = graph.recipe_quantity[recipes]
+    with np.errstate(invalid='ignore'):
+        unit_costs = np.where(quantity_produced > 0, totals / np.maximum(quantity_produced, 1), totals)
+    unit_costs[~craftable[recipes]] = np.inf
+
+    # Cheapest recipe of every item, the first one by recipe_id on ties; NaN never wins
+    starts = np.flatnonzero(np.r_[True, recipe_item[1:] != recipe_item[:-1]])
+    cheapest = np.fmin.reduceat(unit_costs, starts)
+    candidates = np.flatnonzero(unit_costs == cheapest[recipe_item])
+    positions, first = np.unique(recipe_item[candidates], return_index=True)
+    best_recipes = candidates[first]
+
+    # Crafting wins ties with the market, like it always did
+    best_items = items[positions]
+    best_costs = unit_costs[best_recipes]
+    better = (best_costs <= cost[best_items]) & np.isfinite(best_costs)
+    cost[best_items[better]] = best_costs[better]
+    recipe_choice[best_items[better]] = recipes[best_recipes[better]]
+
+
+def solve_costs_vectorized(graph, craftable, previous=None, affected=None):
+    """
+    Same costs and recipe choices as solve_costs, computed one topological level at a time
+    with NumPy: the reagent rows of a level form a sparse recipe x item quantity matrix, so
+    the recipe costs of the level are one weighted bincount over those rows, and the
+    cheapest recipe of each item one segmented minimum. Recipe loops go through the same
+    solve_loop as solve_costs.
+
+    Args:
+    - graph: The CraftingGraph of the server
+    - craftable: Boolean array over recipes, see player_operations.CraftabilityIndex
+    - previous: CostTable of the same graph to start from; only the affected items are solved again
+    - affected: Boolean array over items, closed under CraftingGraph.dependent_items, used with previous
+
+    Returns:
+    - The CostTable of the character
+    """
+    resolved = graph.resolve_reagents()
+    loop_craftable = craftable & graph.resolvable_recipes()
+    cost, recipe_choice = _starting_costs(graph, previous, affected)
+    previous_loops = _previous_loops(graph, previous)
+    loops = []
+
+    for group in graph.level_groups():
+        if affected is not None:
+            solved = affected[graph.recipe_result[group["recipes"]]]
+            if not solved.all():
+                group = graph.recipe_group(group["level"], group["recipes"][solved], group["loops"])
+        if len(group["recipes"]):
+            _solve_level(graph, group, resolved, craftable, cost, recipe_choice)
+        for loop_items in group["loops"]:
+            if affected is not None and not affected[loop_items].any():
+                loops.append(previous_loops[tuple(loop_items.tolist())])
+            else:
+                loops.append(solve_loop(graph, loop_items, cost, recipe_choice, loop_craftable))
+
+    return _cost_table(graph, cost.tolist(), recipe_choice.tolist(), loops, previous, affected)
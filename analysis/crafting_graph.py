@@ -0,0 +1,426 @@
+#analysis/crafting_graph.py
+
+import numpy as np
+from sqlalchemy import func
+from database.models import CraftingRecipe, CurrentPrice, RecipeReagent, item_itemtype_association
+from database.operations.item_operations import get_item_type_index
+
+
+def _offsets(owners, count):
+    """Returns the CSR offsets of rows grouped by owner: rows of owner i are offsets[i]:offsets[i + 1]."""
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(np.asarray(owners, dtype=np.int64), minlength=count), out=offsets[1:])
+    return offsets
+
+
+class CraftingGraph:
+    """
+    The recipes, reagents, item type memberships and current prices of one server, loaded
+    with a handful of bulk queries into integer-indexed NumPy arrays.
+
+    Items, recipes and item types are numbered from 0 and every relation is stored as a
+    CSR pair of arrays, e.g. the reagents of recipe r are rows
+    reagent_offsets[r]:reagent_offsets[r + 1] of reagent_item, reagent_type and
+    reagent_quantity. Rows keep the order the ORM would have loaded them in, so walking
+    the graph visits recipes and reagents in the same order as the database queries did.
+    """
+
+    def __init__(self, server_id):
+        self.server_id = server_id
+        self._resolved_reagents = None
+        self._edges = None
+        self._components = None
+        self._loops = None
+        self._levels = None
+        self._level_groups = None
+
+    @staticmethod
+    def structure_key(session):
+        """
+        Cheap signature of the recipes, reagents and item type memberships: row counts,
+        largest IDs and column totals, from three aggregate queries. It changes whenever
+        rows are added or removed, e.g. by init_database.
+        """
+        recipes = session.query(
+            func.count(CraftingRecipe.recipe_id), func.max(CraftingRecipe.recipe_id),
+            func.total(CraftingRecipe.recipe_id), func.total(CraftingRecipe.quantity_produced)
+        ).one()
+        reagents = session.query(
+            func.count(RecipeReagent.id), func.max(RecipeReagent.id), func.total(RecipeReagent.quantity_required)
+        ).one()
+        memberships = session.query(
+            func.count(), func.total(item_itemtype_association.c.item_type_id),
+            func.count(func.distinct(item_itemtype_association.c.item_id))
+        ).select_from(item_itemtype_association).one()
+        return tuple(recipes), tuple(reagents), tuple(memberships)
+
+    @classmethod
+    def load(cls, session, server_id):
+        graph = cls(server_id)
+        # Taken first, so rows added while loading make the next comparison fail
+        graph.structure = cls.structure_key(session)
+        item_index = {}
+
+        def index_of(item_id):
+            if item_id not in item_index:
+                item_index[item_id] = len(item_index)
+            return item_index[item_id]
+
+        recipes = session.query(
+            CraftingRecipe.recipe_id, CraftingRecipe.result_item_id, CraftingRecipe.quantity_produced
+        ).order_by(CraftingRecipe.recipe_id).all()
+        recipe_index = {recipe_id: index for index, (recipe_id, _, _) in enumerate(recipes)}
+        graph.recipe_ids = np.array([recipe_id for recipe_id, _, _ in recipes], dtype=np.int64)
+        graph.recipe_result = np.array([index_of(item_id) for _, item_id, _ in recipes], dtype=np.int64)
+        graph.recipe_quantity = np.array([quantity or 0 for _, _, quantity in recipes], dtype=np.int64)
+
+        # Members of each item type by current price; reagents without an item use the cheapest member
+        item_types = get_item_type_index(session, server_id)
+        graph.item_type_ids = item_types.item_type_ids()
+        type_index = {item_type_id: index for index, item_type_id in enumerate(graph.item_type_ids)}
+
+        reagents = [
+            row for row in session.query(
+                RecipeReagent.recipe_id, RecipeReagent.reagent_item_id,
+                RecipeReagent.reagent_item_type_id, RecipeReagent.quantity_required
+            ).order_by(RecipeReagent.id)
+            if row[0] in recipe_index
+        ]
+        reagents.sort(key=lambda row: recipe_index[row[0]])  # Stable, keeps the id order within a recipe
+        graph.reagent_recipe = np.array([recipe_index[row[0]] for row in reagents], dtype=np.int64)
+        graph.reagent_offsets = _offsets(graph.reagent_recipe, len(recipes))
+        graph.reagent_item = np.array([index_of(item_id) if item_id else -1 for _, item_id, _, _ in reagents],
+                                      dtype=np.int64)
+        graph.reagent_type = np.array([
+            type_index.get(item_type_id, -1) if not item_id else -1
+            for _, item_id, item_type_id, _ in reagents
+        ], dtype=np.int64)
+        graph.reagent_quantity = np.array([quantity for _, _, _, quantity in reagents], dtype=np.int64)
+
+        members = [(type_index[item_type_id], index_of(item_id))
+                   for item_type_id in type_index for item_id in item_types.members(item_type_id)]
+
+        current_prices = session.query(
+            CurrentPrice.item_id, CurrentPrice.price, CurrentPrice.availability, CurrentPrice.highest_buy_order
+        ).filter(CurrentPrice.server_id == server_id).all()
+        priced = [(index_of(item_id), price, availability, highest_buy_order)
+                  for item_id, price, availability, highest_buy_order in current_prices]
+
+        # Every item seen is numbered by now
+        count = len(item_index)
+        graph.item_ids = [None] * count
+        for item_id, index in item_index.items():
+            graph.item_ids[index] = item_id
+        graph.item_index = item_index
+
+        graph.has_price = np.zeros(count, dtype=bool)
+        graph.price = np.full(count, np.inf)
+        graph.availability = np.zeros(count, dtype=np.int64)
+        graph.highest_buy_order = np.full(count, np.nan)
+        for index, price, availability, highest_buy_order in priced:
+            graph.has_price[index] = True
+            graph.price[index] = price
+            graph.availability[index] = availability
+            graph.highest_buy_order[index] = highest_buy_order if highest_buy_order is not None else np.nan
+
+        order = np.argsort(graph.recipe_result, kind='stable')
+        graph.item_recipe_offsets = _offsets(graph.recipe_result, count)
+        graph.item_recipes = order
+
+        graph.type_member_offsets = _offsets([item_type for item_type, _ in members], len(type_index))
+        graph.type_members = np.array([item for _, item in members], dtype=np.int64)
+        return graph
+
+    def update_prices(self, session):
+        """
+        Reloads the current prices of the server in place after a refresh, re-sorts the
+        item type members and resolves the reagents again. Cached graph structure is
+        dropped, the item numbering is kept, so the recipes, reagents and item type
+        memberships must be the ones loaded, see structure_key.
+
+        Returns:
+        - Boolean array over items whose price changed, or whose recipe now resolves a
+          reagent to another item: the items whose cost has to be solved again
+        - Boolean array over items whose availability or highest buy order changed
+        """
+        has_price = np.zeros(self.item_count, dtype=bool)
+        price = np.full(self.item_count, np.inf)
+        availability = np.zeros(self.item_count, dtype=np.int64)
+        highest_buy_order = np.full(self.item_count, np.nan)
+        for item_id, item_price, item_availability, item_highest_buy_order in session.query(
+            CurrentPrice.item_id, CurrentPrice.price, CurrentPrice.availability, CurrentPrice.highest_buy_order
+        ).filter(CurrentPrice.server_id == self.server_id):
+            index = self.item_index.get(item_id)
+            if index is None:
+                continue
+            has_price[index] = True
+            price[index] = item_price
+            availability[index] = item_availability
+            highest_buy_order[index] = item_highest_buy_order if item_highest_buy_order is not None else np.nan
+
+        cost_changed = (has_price != self.has_price) | (price != self.price)
+        other_changed = (availability != self.availability) | ~(
+            (highest_buy_order == self.highest_buy_order) | (np.isnan(highest_buy_order) & np.isnan(self.highest_buy_order))
+        )
+        self.has_price, self.price = has_price, price
+        self.availability, self.highest_buy_order = availability, highest_buy_order
+
+        item_types = get_item_type_index(session, self.server_id)
+        self.type_members = np.array([
+            self.item_index[item_id] for item_type_id in self.item_type_ids for item_id in item_types.members(item_type_id)
+        ], dtype=np.int64)
+
+        previous = self.resolve_reagents()
+        self._resolved_reagents = self._edges = self._components = self._loops = None
+        self._levels = self._level_groups = None
+        moved = np.unique(self.reagent_recipe[self.resolve_reagents() != previous])
+        cost_changed[self.recipe_result[moved]] = True
+        return cost_changed, other_changed
+
+    @property
+    def item_count(self):
+        return len(self.item_ids)
+
+    @property
+    def recipe_count(self):
+        return len(self.recipe_ids)
+
+    def recipe_outputs(self):
+        """Indices of the items some recipe makes, in the order of their first recipe."""
+        outputs, first_recipe = np.unique(self.recipe_result, return_index=True)
+        return outputs[np.argsort(first_recipe)]
+
+    def recipes_of(self, item):
+        """Indices of the recipes producing an item, by recipe_id."""
+        return self.item_recipes[self.item_recipe_offsets[item]:self.item_recipe_offsets[item + 1]]
+
+    def reagent_rows(self, recipe):
+        return range(self.reagent_offsets[recipe], self.reagent_offsets[recipe + 1])
+
+    def type_members_by_price(self, item_type):
+        return self.type_members[self.type_member_offsets[item_type]:self.type_member_offsets[item_type + 1]]
+
+    def resolve_reagents(self):
+        """
+        Returns the item used for every reagent row: the row's item, or for an item type
+        the cheapest member by market price not already used earlier in the same recipe,
+        -1 when none is left. Cached, as it only depends on the current prices.
+        """
+        if self._resolved_reagents is not None:
+            return self._resolved_reagents
+
+        resolved = self.reagent_item.copy()
+        reagent_type = self.reagent_type.tolist()
+        for recipe in np.unique(self.reagent_recipe[self.reagent_item < 0]).tolist():
+            used = set()
+            for row in self.reagent_rows(recipe):
+                if resolved[row] < 0 and reagent_type[row] >= 0:
+                    for member in self.type_members_by_price(reagent_type[row]).tolist():
+                        if member not in used:
+                            resolved[row] = member
+                            break
+                if resolved[row] >= 0:
+                    used.add(int(resolved[row]))
+        self._resolved_reagents = resolved
+        return resolved
+
+    def resolvable_recipes(self):
+        """Boolean array over recipes: whether every reagent row resolves to an item."""
+        unresolved = self.reagent_recipe[self.resolve_reagents() < 0]
+        return np.bincount(unresolved, minlength=self.recipe_count) == 0
+
+    def _recipe_edges(self):
+        """
+        Returns the reagent -> result edges of the resolvable recipes as a CSR pair
+        (edge_offsets, edge_targets) of lists over items, and the edge sources and targets
+        as arrays. Cached, as it only depends on the current prices.
+        """
+        if self._edges is not None:
+            return self._edges
+
+        resolved = self.resolve_reagents()
+        rows = np.nonzero(self.resolvable_recipes()[self.reagent_recipe] & (resolved >= 0))[0]
+        sources = resolved[rows]
+        targets = self.recipe_result[self.reagent_recipe[rows]]
+
+        order = np.argsort(sources, kind='stable')
+        edge_offsets = _offsets(sources, self.item_count).tolist()
+        edge_targets = targets[order].tolist()
+        self._edges = edge_offsets, edge_targets, sources, targets
+        return self._edges
+
+    def strongly_connected_components(self):
+        """
+        Returns the strongly connected component of every item in the recipe graph, with
+        Tarjan's algorithm: items share a component when each is, directly or not, a
+        reagent of the other. Components are numbered in reverse topological order, so a
+        component only uses reagents from components with a higher number. Cached, as it
+        only depends on the current prices.
+        """
+        if self._components is not None:
+            return self._components
+
+        edge_offsets, edge_targets, sources, targets = self._recipe_edges()
+        count = self.item_count
+        index = [-1] * count
+        lowlink = [0] * count
+        on_stack = [False] * count
+        stack = []
+        component = [-1] * count
+        component_count = 0
+        visited = 0
+
+        # Iterative, recipe chains can be deeper than the recursion limit
+        for root in range(count):
+            if index[root] >= 0:
+                continue
+            index[root] = lowlink[root] = visited
+            visited += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, edge_offsets[root])]
+            while work:
+                item, edge = work[-1]
+                if edge < edge_offsets[item + 1]:
+                    work[-1] = (item, edge + 1)
+                    target = edge_targets[edge]
+                    if index[target] < 0:
+                        index[target] = lowlink[target] = visited
+                        visited += 1
+                        stack.append(target)
+                        on_stack[target] = True
+                        work.append((target, edge_offsets[target]))
+                    elif on_stack[target]:
+                        lowlink[item] = min(lowlink[item], index[target])
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[item])
+                if lowlink[item] == index[item]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = component_count
+                        if member == item:
+                            break
+                    component_count += 1
+
+        self._components = np.array(component, dtype=np.int64)
+
+        # A component is a loop when it has several items, or one item used in its own recipe
+        sizes = np.bincount(self._components, minlength=component_count)
+        cyclic = sizes > 1
+        cyclic[self._components[sources[sources == targets]]] = True
+        loop_items = np.nonzero(cyclic[self._components])[0]
+        loop_items = loop_items[np.argsort(-self._components[loop_items], kind='stable')]
+        self._loops = [
+            items for items in np.split(loop_items, np.flatnonzero(np.diff(self._components[loop_items])) + 1)
+            if len(items)
+        ]
+        return self._components
+
+    def recipe_loops(self):
+        """
+        Returns the recipe loops of the graph, such as refining conversions that can be
+        undone: one array of item indices per cyclic strongly connected component, in
+        topological order.
+        """
+        self.strongly_connected_components()
+        return self._loops
+
+    def topological_levels(self):
+        """
+        Returns the level of every item in the recipe graph, with every recipe loop
+        collapsed into one node: 0 for items no usable recipe makes, otherwise one more
+        than the highest level among the reagents from outside its loop. Every reagent has
+        a lower level than what it is used for, or the same level when both are on the same
+        loop, so solving items by increasing level solves reagents first. Cached, as it
+        only depends on the current prices.
+        """
+        if self._levels is not None:
+            return self._levels
+
+        components = self.strongly_connected_components()
+        edge_offsets, edge_targets, _, _ = self._recipe_edges()
+        component_list = components.tolist()
+        component_levels = [0] * (max(component_list) + 1 if component_list else 0)
+
+        # Highest component number first is a topological order of the components
+        for item in np.argsort(-components, kind='stable').tolist():
+            component = component_list[item]
+            for edge in range(edge_offsets[item], edge_offsets[item + 1]):
+                target = component_list[edge_targets[edge]]
+                if target != component:
+                    component_levels[target] = max(component_levels[target], component_levels[component] + 1)
+
+        self._levels = np.array(component_levels, dtype=np.int64)[components] if component_list \
+            else np.zeros(0, dtype=np.int64)
+        return self._levels
+
+    def level_groups(self):
+        """
+        Splits the resolvable recipes by the topological level of the item they make, for
+        solving a whole level at once. Returns a list of dictionaries, by increasing level:
+        - recipes: the recipes of the level making items on no loop, grouped by result item,
+          by recipe_id within an item
+        - items: the distinct result items, recipe_item maps each recipe to its position in items
+        - rows, row_recipe: the reagent rows of those recipes and the position of their recipe
+        - loops: the recipe loops of the level, see recipe_loops
+        Cached, as it only depends on the current prices.
+        """
+        if self._level_groups is not None:
+            return self._level_groups
+
+        levels = self.topological_levels()
+        on_loop = np.zeros(self.item_count, dtype=bool)
+        loops_by_level = {}
+        for items in self.recipe_loops():
+            on_loop[items] = True
+            loops_by_level.setdefault(int(levels[items[0]]), []).append(items)
+
+        resolvable = np.nonzero(self.resolvable_recipes() & ~on_loop[self.recipe_result])[0]
+        recipe_levels = levels[self.recipe_result[resolvable]]
+
+        groups = []
+        for level in sorted(set(recipe_levels.tolist()) | set(loops_by_level)):
+            groups.append(self.recipe_group(level, resolvable[recipe_levels == level], loops_by_level.get(level, [])))
+
+        self._level_groups = groups
+        return groups
+
+    def recipe_group(self, level, recipes, loops=()):
+        """Builds a level_groups entry out of some recipes of a level and the loops of the level."""
+        recipes = recipes[np.argsort(self.recipe_result[recipes], kind='stable')]
+        items, recipe_item = np.unique(self.recipe_result[recipes], return_inverse=True)
+
+        counts = self.reagent_offsets[recipes + 1] - self.reagent_offsets[recipes]
+        row_recipe = np.repeat(np.arange(len(recipes)), counts)
+        starts = np.repeat(self.reagent_offsets[recipes], counts)
+        rows = starts + np.arange(len(row_recipe)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return {
+            "level": level, "recipes": recipes, "items": items, "recipe_item": recipe_item.reshape(-1),
+            "rows": rows, "row_recipe": row_recipe, "loops": list(loops),
+        }
+
+    def dependent_items(self, items):
+        """
+        Returns a boolean array over items: the given items and every item made from them,
+        directly or through other recipes, i.e. the items whose cost may change when the
+        cost of the given items does. Walks the reagent -> result edges, the reverse of the
+        reagent lists, one recipe level per step.
+
+        Args:
+        - items: Boolean array over items, or item indices
+        """
+        _, _, sources, targets = self._recipe_edges()
+        dependent = np.zeros(self.item_count, dtype=bool)
+        dependent[items] = True
+        while True:
+            reached = np.zeros(self.item_count, dtype=bool)
+            reached[targets[dependent[sources]]] = True
+            reached &= ~dependent
+            if not reached.any():
+                return dependent
+            dependent |= reached
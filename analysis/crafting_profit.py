@@ -1,164 +1,261 @@
 #analysis/crafting_profit.py
 
-from database.models import CraftingRecipe
-import database.operations.current_price_operations as cpo
-import database.operations.recipe_operations as ro
-import database.operations.player_operations as po
+import math
+import time
+import numpy as np
 import database.operations.item_operations as io
-from analysis.price_analysis import analyze_market_health
+import database.operations.player_operations as po
+from database.models import Player
+from analysis.crafting_graph import CraftingGraph
+from analysis.cost_solver import solve_costs, solve_costs_vectorized
+from analysis.price_analysis import STREAM_TOP_K, analyze_market_health, rank_items, stream_market_health
+
+
+def player_craftable(session, player_id, graph):
+    """Craftable flag of every recipe of the graph for a player, from the player's CraftabilityIndex."""
+    craftable = po.get_craftability_index(session, player_id).craftable_of(graph.recipe_ids)
+    if craftable is None:
+        # Recipes were added since the index was built
+        po.invalidate_craftability(player_id)
+        craftable = po.get_craftability_index(session, player_id).craftable_of(graph.recipe_ids)
+    return craftable
+
+
+def profitability_record(item_id, crafting_cost, market_price, availability, highest_buy_order, crafting_tree=None):
+    """
+    The profitability dictionary reported for a crafted item, None when its profit margin
+    is under 5%. highest_buy_order is NaN or 0 when the item has no buy order, and
+    crafting_tree is the item's CraftingNode, see cost_solver.CraftingNode.materialize.
+    """
+    buy_price = highest_buy_order if highest_buy_order and not math.isnan(highest_buy_order) else None
+    profit = market_price - crafting_cost
+    profit_margin = (profit / crafting_cost) * 100 if crafting_cost != 0 else 0
+
+    if profit_margin < 5:
+        return None
+
+    return {
+        "Item ID": item_id,
+        "Crafting Tree": crafting_tree,
+        "Profit": profit,
+        "Profit Margin": profit_margin,
+        "Crafting Cost": crafting_cost,
+        "Market Price": market_price,
+        "Availability": availability,
+        "Buy Price": buy_price
+    }
+
+
+def report_loops(costs, server_id):
+    """Prints the recipe loops solved for a CostTable, see cost_solver.solve_loop."""
+    if costs.loops:
+        print(f"Solved {len(costs.loops)} recipe loops on server {server_id}")
+        for loop in costs.loops:
+            if not loop["converged"]:
+                print(f"Recipe loop {', '.join(map(str, loop['items']))} keeps getting cheaper "
+                      f"after {loop['rounds']} rounds, crafting around it is ignored")
+
 
 class CraftingProfitAnalyzer:
-    def __init__(self, session, server_id, player_id):
+    def __init__(self, session, server_id, player_id, vectorized=True):
         self.session = session
         self.server_id = server_id
         self.player_id = player_id
+        self.vectorized = vectorized  # Solve whole topological levels with NumPy instead of item by item
+        self.graph = None
+        self.craftable = None
+        self.costs = None
+        self.results = None  # Ranked results of the last evaluation, patched by refresh_recipes
+        self.last_refresh = None
+        self.last_stream = None
 
 
-    def calculate_item_cost(self, item_id, market_price):
+    def load_graph(self):
         """
-        Calculates the cost of an item either by crafting or market price.
-        Compares crafting cost with market price and stops crafting computation 
-        if the cost exceeds market price.
+        Loads the recipe graph and current prices of the server, and which recipes the
+        player can craft, then solves the cost of every item once for this run. Reports the
+        recipe loops found, see cost_solver.solve_loop.
         """
-        # Fetch potential crafting recipes for the item
-        recipes = ro.get_recipes_by_item(self.session, item_id)
-
-        # If no crafting recipes are found, return the market price
-        if not recipes:
-            return market_price, {}
-
-        # For each crafting recipe, determine the cost and compare it to the market price
-        cheapest_crafting_cost = float('inf')
-        cheapest_crafting_tree = {}
-        for recipe in recipes:
-            crafting_cost, crafting_tree = self.get_crafting_cost(recipe, market_price)
-
-            # If the crafting cost for this recipe is cheaper, update the cheapest cost and tree
-            if crafting_cost < cheapest_crafting_cost:
-                cheapest_crafting_cost = crafting_cost
-                cheapest_crafting_tree = crafting_tree
+        self.graph = CraftingGraph.load(self.session, self.server_id)
+        self.craftable = player_craftable(self.session, self.player_id, self.graph)
+        solve = solve_costs_vectorized if self.vectorized else solve_costs
+        self.costs = solve(self.graph, self.craftable)
+        report_loops(self.costs, self.server_id)
 
-            # If at any point the crafting cost surpasses the market price, return market price
-            if cheapest_crafting_cost > market_price:
-                return market_price, {}
-            
 
-        return cheapest_crafting_cost, cheapest_crafting_tree
-
-
-    def get_reagent_item_id(self, reagent, used_reagents):
+    def profitable_items(self):
         """
-        Determines the reagent item ID for crafting, prioritizing specific item IDs or selecting from available item types.
+        Boolean array over items: whether calculate_profitability reports the item, i.e. it
+        has a market price and a profit margin of at least 5% over its cost.
         """
-        if reagent.reagent_item_id:
-            return reagent.reagent_item_id
-
-        potential_items = io.get_items_for_item_type(self.session, reagent.reagent_item_type_id, self.server_id)  # Returns sorted by market price
-        potential_items = [item for item in potential_items if item.item_id not in used_reagents]  # Filter out already used reagents
-
-        if not potential_items:
-            return None  # No valid items to use for this reagent
-
-        # Assuming potential_items is sorted by price, return the cheapest one
-        return potential_items[0].item_id
+        graph = self.graph
+        cost = np.asarray(self.costs.cost)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profit_margin = np.where(cost != 0, (graph.price - cost) / cost * 100, 0)
+        return graph.has_price & ~(profit_margin < 5)
 
 
-    def get_crafting_cost(self, recipe, market_price, accumulated_cost=0):
+    def calculate_profitability(self, item):
         """
-        Calculates the crafting cost of a given recipe while considering the market price.
+        Calculate profitability for an item based on crafting or buying.
         """
-        # Check if the player can craft the given recipe
-        can_craft = po.can_craft_recipe(self.session, self.player_id, recipe.recipe_id)
-        if not can_craft:
-            result_market_price_data = cpo.get_current_price(self.session, recipe.result_item_id, self.server_id)
-            return result_market_price_data['price'] if result_market_price_data else float('inf'), {}
-
-        total_cost = accumulated_cost
-        crafting_tree = {}
-
-        local_used_reagents = set()  # For item type uniqueness within this recipe level
-        for reagent in recipe.recipe_reagents:
-            reagent_item_id = self.get_reagent_item_id(reagent, local_used_reagents)
-            if not reagent_item_id:
-                return float('inf'), {}
-
-            local_used_reagents.add(reagent_item_id)
-
-            reagent_quantity = reagent.quantity_required
-
-            # Calculate cost for the reagent
-            reagent_market_price_data = cpo.get_current_price(self.session, reagent_item_id, self.server_id)
-            reagent_market_price = reagent_market_price_data['price'] if reagent_market_price_data else float('inf')
-            reagent_cost, reagent_tree = self.calculate_item_cost(reagent_item_id, reagent_market_price)
-
-
-            # If at any point, the accumulated cost surpasses the market price, return market price
-            total_cost += reagent_cost * reagent_quantity
-            if total_cost > market_price:
-                return market_price, {}
-
-            crafting_tree[reagent_item_id] = {
-                'cost': reagent_cost,
-                'quantity': reagent_quantity,
-                'source': 'crafted' if reagent_tree else 'market',
-                'children': reagent_tree
-            }
+        graph = self.graph
+        if not graph.has_price[item]:
+            return None
 
-        # Adjust for the quantity produced by the recipe
-        unit_cost = total_cost / recipe.quantity_produced if recipe.quantity_produced else total_cost
+        # Cheapest of crafting and buying, from the cost table
+        crafting_cost = self.costs.cost[item]
+        record = profitability_record(
+            graph.item_ids[item], crafting_cost, float(graph.price[item]), int(graph.availability[item]),
+            float(graph.highest_buy_order[item])
+        )
+        if record is not None:
+            # Only the shared root node, the nested tree is built when the item is displayed
+            record["Crafting Tree"] = self.costs.crafting_node(item)
+        return record
 
-        # Include any crafting fee (assumed to be 0 for simplicity)
-        unit_cost += 0  # Adjust if there's a crafting fee
-        
-        return unit_cost, crafting_tree
 
 
-    def calculate_profitability(self, item_id):
+    def evaluate_all_recipes(self, callback=None):
         """
-        Calculate profitability for an item based on crafting or buying.
+        Evaluate profitability for all recipes in the database.
         """
-        market_price_data = cpo.get_current_price(self.session, item_id, self.server_id)
-        if not market_price_data:
-            return None
+        self.load_graph()
+        self.results = self.rank_recipes(callback)
+        return self.results
 
-        market_price = market_price_data['price']
-        buy_price = market_price_data['highest_buy_order'] if market_price_data['highest_buy_order'] else None
 
-        # Calculate crafting cost for the item
-        crafting_cost, crafting_tree = self.calculate_item_cost(item_id, market_price)  # Pass the market_price here
-        profit = market_price - crafting_cost
-        profit_margin = (profit / crafting_cost) * 100 if crafting_cost != 0 else 0
-        availability = market_price_data['availability'] if market_price_data else 0
+    def refresh_recipes(self, callback=None):
+        """
+        Re-evaluates the recipes after a price refresh. Only the items whose price changed
+        and the items made from them, directly or not, are costed again, and only their
+        entries of the last results are rebuilt, fetching price histories for those alone;
+        the results are then re-ranked and patched in place. Evaluates everything when
+        there are no results yet, or when the recipes the player can craft changed.
+
+        Returns:
+        - The patched results, the same dictionary evaluate_all_recipes returned
+        """
+        for _ in self.stream_recipes(callback=callback):
+            pass
+        return self.results
 
-        if profit_margin < 5:
-            return None
 
-        return {
-            "Item ID": item_id,
-            "Crafting Tree": crafting_tree,
-            "Profit": profit,
-            "Profit Margin": profit_margin,
-            "Crafting Cost": crafting_cost,
-            "Market Price": market_price,
-            "Availability": availability,
-            "Buy Price": buy_price
+    def update_costs(self):
+        """
+        Brings the costs up to date with the server's current prices: the items whose
+        price changed and the items made from them are solved again, starting from the
+        last costs. Loads and solves everything when nothing was loaded yet, when recipes,
+        reagents or item type memberships were added or removed since, or when the
+        recipes the player can craft changed.
+
+        Returns:
+        - None when everything was solved, else (cost_changed, affected, other_changed)
+          boolean arrays over items, see CraftingGraph.update_prices
+        """
+        structure = CraftingGraph.structure_key(self.session) if self.graph is not None else None
+        if structure is not None and structure[2] != self.graph.structure[2]:
+            # Item types gained or lost members, the cached index of the server is out of date too
+            io.invalidate_item_type_index(self.server_id)
+        if structure is not None and structure == self.graph.structure:
+            craftable = player_craftable(self.session, self.player_id, self.graph)
+            if np.array_equal(craftable, self.craftable):
+                cost_changed, other_changed = self.graph.update_prices(self.session)
+                affected = self.graph.dependent_items(cost_changed)
+                solve = solve_costs_vectorized if self.vectorized else solve_costs
+                self.costs = solve(self.graph, self.craftable, self.costs, affected)
+                return cost_changed, affected, other_changed
+        self.load_graph()
+        return None
+
+
+    def stream_recipes(self, top_k=STREAM_TOP_K, callback=None):
+        """
+        Generator version of refresh_recipes, yielding the top_k of the results as they are
+        ranked, see price_analysis.stream_market_health. The entries kept from the last
+        results are ranked first, so after the first evaluation the top is shown before
+        any price history is looked up. The results are patched once the stream is done;
+        a stream stopped half way drops them, and the next one evaluates everything.
+
+        Yields:
+        - The current top_k ranked results, the last one final
+        """
+        start_time = time.perf_counter()
+        changes = self.update_costs()
+        graph = self.graph
+        if self.results is None or changes is None:
+            items_dict, assessed = self.profitable_recipes(), ()
+        else:
+            # Rebuild the entries of the items that may have changed, keep the others
+            cost_changed, affected, other_changed = changes
+            revisit = (affected | other_changed).tolist()
+            profitable = self.profitable_items().tolist()
+            items_dict, assessed = {}, []
+            for item in graph.recipe_outputs().tolist():
+                item_id = graph.item_ids[item]
+                if not revisit[item]:
+                    if item_id in self.results:
+                        items_dict[item_id] = self.results[item_id]
+                        assessed.append(item_id)
+                elif profitable[item]:
+                    profitability_data = self.calculate_profitability(item)
+                    if profitability_data:
+                        items_dict[item_id] = profitability_data
+
+        completed = False
+        try:
+            self.last_stream = yield from stream_market_health(
+                self.session, self.server_id, items_dict, assessed, top_k, callback
+            )
+            completed = True
+        finally:
+            if not completed:
+                # The costs moved on without the results
+                self.results = None
+
+        # Re-rank in evaluation order, like evaluate_all_recipes would
+        ranked = rank_items(items_dict)
+        if self.results is None or changes is None:
+            self.results = ranked
+            return
+        self.results.clear()
+        self.results.update(ranked)
+
+        recosted = int(np.count_nonzero(affected[graph.recipe_result]))
+        self.last_refresh = {
+            "changed_items": int(np.count_nonzero(cost_changed | other_changed)),
+            "recosted": recosted,
+            "skipped": graph.recipe_count - recosted,
+            "elapsed": time.perf_counter() - start_time,
         }
+        print(f"Re-evaluated {recosted} of {graph.recipe_count} recipes after "
+              f"{self.last_refresh['changed_items']} price changes, {self.last_refresh['skipped']} recipes skipped "
+              f"in {self.last_refresh['elapsed']:.2f}s")
 
 
+    def rank_recipes(self, callback=None):
+        """
+        Ranks the profitable recipes of the loaded graph and costs by market health.
+        """
+        return analyze_market_health(self.session, self.server_id, self.profitable_recipes(callback))
 
-    def evaluate_all_recipes(self, callback=None):
+
+    def profitable_recipes(self, callback=None):
         """
-        Evaluate profitability for all recipes in the database.
+        Returns the profitability of every recipe output worth crafting, by item_id, from
+        the loaded graph and costs.
         """
-        all_recipes = self.session.query(CraftingRecipe).all()
-        total_recipes = len(all_recipes)
+        total_recipes = self.graph.recipe_count
         profitability_info = {}
+        profitable = self.profitable_items().tolist()
+
+        for index, item in enumerate(self.graph.recipe_result.tolist()):
+            if not profitable[item]:
+                continue
+            item_id = self.graph.item_ids[item]
+
+            profitability_data = self.calculate_profitability(item)
 
-        for index, recipe in enumerate(all_recipes):
-            item_id = recipe.result_item_id
-            
-            profitability_data = self.calculate_profitability(item_id)
-            
             if not profitability_data:
                 continue
 
@@ -168,5 +265,98 @@ class CraftingProfitAnalyzer:
             if callback:
                 callback(index + 1, total_recipes)
 
-        return analyze_market_health(self.session, self.server_id, profitability_info)
-
+        return profitability_info
+
+
+def solve_all_players(session, server_id, player_ids=None, vectorized=True):
+    """
+    Solves the costs of several characters of a server in one pass. The graph, the reagent
+    resolution and the topological levels are shared, players who can craft the same
+    recipes are solved once, and every other skill set starts from the costs of the most
+    common one and only re-solves the items made, directly or not, with a recipe whose
+    craftability differs.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_id: ID of the server to evaluate
+    - player_ids: Players to evaluate, every player of the server by default
+    - vectorized: Solve with solve_costs_vectorized instead of solve_costs
+
+    Returns:
+    - The CraftingGraph of the server and a list of (craftable, costs, player_ids) per
+      distinct skill set, the most common first
+    """
+    graph = CraftingGraph.load(session, server_id)
+    if player_ids is None:
+        player_ids = [
+            player_id for player_id, in session.query(Player.player_id).filter(
+                Player.server_id == server_id
+            ).order_by(Player.player_id)
+        ]
+
+    skill_sets = {}
+    for player_id in player_ids:
+        craftable = player_craftable(session, player_id, graph)
+        skill_sets.setdefault(craftable.tobytes(), (craftable, []))[1].append(player_id)
+
+    solve = solve_costs_vectorized if vectorized else solve_costs
+    solved = []
+    for craftable, players in sorted(skill_sets.values(), key=lambda skill_set: -len(skill_set[1])):
+        if not solved:
+            costs = solve(graph, craftable)
+            report_loops(costs, server_id)
+        else:
+            base_craftable, base_costs, _ = solved[0]
+            gated_items = np.unique(graph.recipe_result[craftable != base_craftable])
+            costs = solve(graph, craftable, base_costs, graph.dependent_items(gated_items))
+        solved.append((craftable, costs, players))
+    return graph, solved
+
+
+def stream_recipes_job(session, analyzer, callback, top_k=STREAM_TOP_K):
+    """
+    Runs analyzer.stream_recipes on the session of a background worker, see
+    data_input.ingest_worker.IngestWorker, which owns the analyzer until it is done; the
+    analyzer gets its own session back afterwards. Posts ("ranking", results) for every
+    ranking and ("progress", (current, total)) through callback.
+
+    Returns:
+    - The stream_market_health stats of the run
+    """
+    analyzer_session, analyzer.session = analyzer.session, session
+    try:
+        stream = analyzer.stream_recipes(top_k, lambda current, total: callback(("progress", (current, total))))
+        try:
+            for ranking in stream:
+                callback(("ranking", ranking))
+        finally:
+            stream.close()
+    finally:
+        analyzer.session = analyzer_session
+    return analyzer.last_stream
+
+
+def evaluate_all_players(session, server_id, player_ids=None, callback=None, vectorized=True):
+    """
+    Evaluates the recipes of a server for several characters in one pass, see solve_all_players.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_id: ID of the server to evaluate
+    - player_ids: Players to evaluate, every player of the server by default
+    - callback: Progress callback of evaluate_all_recipes, called for each skill set in turn
+    - vectorized: Solve with solve_costs_vectorized instead of solve_costs
+
+    Returns:
+    - Dictionary of player_id to the evaluate_all_recipes result of that player; players
+      with the same craftable recipes share one result
+    """
+    graph, skill_sets = solve_all_players(session, server_id, player_ids, vectorized)
+    results = {}
+    for craftable, costs, players in skill_sets:
+        analyzer = CraftingProfitAnalyzer(session, server_id, players[0], vectorized)
+        analyzer.graph, analyzer.craftable, analyzer.costs = graph, craftable, costs
+        result = analyzer.rank_recipes(callback)
+        for player_id in players:
+            results[player_id] = result
+    return results
@@ -0,0 +1,174 @@
+#analysis/parallel_evaluation.py
+
+"""
+Evaluates the crafting and buy opportunities of several servers without the UI, with the
+work sharded by server across a process pool.
+
+    python -m analysis.parallel_evaluation --workers 4 --top 10
+
+Workers open their own read-only connection to the database and send back NumPy columns
+instead of result dictionaries. Market health ranking, which fetches and caches price
+histories, stays in this process so every request goes through one rate limiter.
+"""
+
+import argparse
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from analysis.buy_profit import BuyProfitAnalyzer
+from analysis.crafting_profit import CraftingProfitAnalyzer, profitability_record, solve_all_players
+from analysis.price_analysis import analyze_market_health
+from config.database_config import DATABASE_PATH
+from database.models import Player, Server, engine
+
+
+def read_only_session(database_path):
+    """Opens a session on a read-only SQLite connection (mode=ro) to the database file."""
+    uri = f"{Path(database_path).resolve().as_uri()}?mode=ro"
+    read_only_engine = create_engine("sqlite://", creator=lambda: sqlite3.connect(uri, uri=True))
+    return sessionmaker(bind=read_only_engine)()
+
+
+def evaluate_shard(database_path, server_id, include_buys=True):
+    """
+    Evaluates one server in a worker process: the costs of every skill set of the
+    server's players, their profitable recipe outputs and the buy candidates.
+
+    Returns:
+    - Payload dictionary with the server_id, worker elapsed seconds, buys and skill_sets:
+      for each skill set the player_ids, and the item_ids, crafting_cost, market_price,
+      availability and highest_buy_order columns of its profitable recipe outputs, in
+      evaluation order
+    """
+    start_time = time.perf_counter()
+    session = read_only_session(database_path)
+    try:
+        graph, skill_sets = solve_all_players(session, server_id)
+
+        # Recipe outputs in the order evaluate_all_recipes visits them
+        outputs = graph.recipe_outputs()
+
+        payload_sets = []
+        for craftable, costs, players in skill_sets:
+            analyzer = CraftingProfitAnalyzer(session, server_id, players[0])
+            analyzer.graph, analyzer.craftable, analyzer.costs = graph, craftable, costs
+            profitable = analyzer.profitable_items()[outputs]
+            items = outputs[profitable]
+            payload_sets.append({
+                "player_ids": players,
+                "item_ids": [graph.item_ids[item] for item in items.tolist()],
+                "crafting_cost": np.asarray(costs.cost)[items],
+                "market_price": graph.price[items],
+                "availability": graph.availability[items],
+                "highest_buy_order": graph.highest_buy_order[items],
+            })
+
+        buys = BuyProfitAnalyzer(session, server_id, None).profitable_buys() if include_buys else {}
+    finally:
+        session.close()
+
+    return {
+        "server_id": server_id, "skill_sets": payload_sets, "buys": buys,
+        "elapsed": time.perf_counter() - start_time,
+    }
+
+
+def rank_shard(session, server_id, shard):
+    """
+    Ranks the payload of a server by market health.
+
+    Returns:
+    - Dictionary with the ranked crafting results by player_id, without crafting trees,
+      and the ranked buy results
+    """
+    crafting = {}
+    for skill_set in shard["skill_sets"]:
+        profitability_info = {}
+        for item_id, crafting_cost, market_price, availability, highest_buy_order in zip(
+            skill_set["item_ids"], np.asarray(skill_set["crafting_cost"]).tolist(),
+            np.asarray(skill_set["market_price"]).tolist(), np.asarray(skill_set["availability"]).tolist(),
+            np.asarray(skill_set["highest_buy_order"]).tolist()
+        ):
+            record = profitability_record(item_id, crafting_cost, market_price, int(availability), highest_buy_order)
+            if record is not None:
+                profitability_info[item_id] = record
+
+        ranked = analyze_market_health(session, server_id, profitability_info)
+        for player_id in skill_set["player_ids"]:
+            crafting[player_id] = ranked
+
+    buys = shard["buys"]
+    return {"crafting": crafting, "buys": analyze_market_health(session, server_id, buys, "buy") if buys else {}}
+
+
+def evaluate_servers(session, server_ids, database_path=DATABASE_PATH, max_workers=None, include_buys=True):
+    """
+    Evaluates every player's recipes and the buy opportunities of several servers, one
+    process pool task per server. Costing a server is not split further, as every recipe
+    output depends on the costs of the whole server.
+
+    Args:
+    - session: Writable SQLAlchemy session of this process, for market health ranking
+    - server_ids: IDs of the servers to evaluate
+    - database_path: Path of the SQLite database the workers read
+    - max_workers: Size of the process pool, the number of CPUs by default
+    - include_buys: Also evaluate the buy opportunities
+
+    Returns:
+    - Dictionary of server_id to the rank_shard result plus the worker seconds spent on it
+    """
+    shards = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(evaluate_shard, database_path, server_id, include_buys)
+            for server_id in server_ids
+        ]
+        for future in as_completed(futures):
+            payload = future.result()
+            shards[payload["server_id"]] = payload
+
+    results = {}
+    for server_id in server_ids:
+        results[server_id] = rank_shard(session, server_id, shards[server_id])
+        results[server_id]["worker_seconds"] = shards[server_id]["elapsed"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="*", help="server IDs to evaluate, every server in the database by default")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size, the number of CPUs by default")
+    parser.add_argument("--top", type=int, default=10, help="results printed per player and server")
+    parser.add_argument("--no-buys", action="store_true", help="skip the buy analysis")
+    args = parser.parse_args()
+
+    session = sessionmaker(bind=engine)()
+    server_ids = args.servers or [server_id for server_id, in session.query(Server.server_id)]
+    player_names = dict(session.query(Player.player_id, Player.player_name))
+
+    start_time = time.perf_counter()
+    results = evaluate_servers(session, server_ids, max_workers=args.workers, include_buys=not args.no_buys)
+    elapsed = time.perf_counter() - start_time
+
+    for server_id, result in results.items():
+        print(f"Server {server_id} ({result['worker_seconds']:.2f}s of worker time)")
+        for player_id, ranked in result["crafting"].items():
+            print(f"  {player_names.get(player_id, player_id)}: {len(ranked)} profitable recipes")
+            for item_id, info in list(ranked.items())[:args.top]:
+                print(f"    {item_id}: profit {info['Profit']:.2f}, margin {info['Profit Margin']:.1f}%")
+        if not args.no_buys:
+            print(f"  Buys: {len(result['buys'])} opportunities")
+            for item_id, info in list(result["buys"].items())[:args.top]:
+                print(f"    {item_id}: margin {info['Profit Margin']:.1f}%")
+    print(f"Evaluated {len(server_ids)} servers in {elapsed:.2f}s")
+    session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,30 @@
 #analysis/price_analysis.py
+import heapq
+import time
 import numpy as np
-from database.operations.cache_operations import get_price_data
+from database.operations.cache_operations import get_price_data, prefetch_price_data
+from config.api_config import PRICE_HISTORY_WORKERS
 
+# Items ranked by stream_market_health, and the seconds between two ranking updates
+STREAM_TOP_K = 50
+STREAM_UPDATE_INTERVAL = 0.25
 
 
-def extract_data_points(item_data):
-    """Extract average availability, average price, and lowest price data points from item_data."""
-    avg_avails = [entry["avg_avail"] for entry in item_data["price_graph_data"]]
-    avg_prices = [entry["avg_price"] for entry in item_data["price_graph_data"]]
-    lowest_prices = [entry["lowest_price"] for entry in item_data["price_graph_data"]]
-    
-    return avg_avails, avg_prices, lowest_prices
+
+def extract_data_points(price_data):
+    """Extract average availability, average price, and lowest price arrays from a PriceHistory."""
+    return price_data.avg_avail, price_data.avg_price, price_data.lowest_price
 
 def calculate_derivative(data_points):
-    """Calculate the derivative (rate of change) of a list of data points."""
-    return [data_points[i+1] - data_points[i] for i in range(len(data_points)-1)]
+    """Calculate the derivative (rate of change) of an array of data points."""
+    return np.diff(data_points)
 
 def is_market_active(derivatives):
     """Check if the market activity is healthy."""
     
     # If more than half the derivatives in any list are zero, market is possibly stagnant
     for key, values in derivatives.items():
-        if len([val for val in values if val == 0]) > len(values) / 2:
+        if np.count_nonzero(values == 0) > len(values) / 2:
             return False
     
     return True
@@ -50,14 +53,11 @@ def calculate_buy_profit_potential(item_data):
 def is_price_trending_upwards(price_data):
     """Check if the price of an item is trending upwards."""
     
-    # Extract the list of lowest prices from price_data
-    lowest_prices = [data_point["lowest_price"] for data_point in price_data["price_graph_data"]]
-
     # Calculate the derivative of the lowest prices
-    price_derivatives = calculate_derivative(lowest_prices)
+    price_derivatives = calculate_derivative(price_data.lowest_price)
 
     # If the last derivative is positive, the price is trending upwards
-    if price_derivatives:
+    if len(price_derivatives):
         return price_derivatives[-1] > 0
     return False
 
@@ -83,6 +83,10 @@ def rank_buy_items(items_dict):
     
     return ranked_dict
 
+def rank_key(item_data):
+    """Sort key of a crafted item analyzed by analyze_market_health, the best item has the largest key."""
+    return (item_data["active"], item_data["upward_price"], item_data["profit_potential"])
+
 def rank_items(items_dict):
     """Rank items based on their scores."""
     
@@ -92,11 +96,7 @@ def rank_items(items_dict):
     # Sort the items based on the given criteria
     ranked_items = sorted(
         items_list,
-        key=lambda x: (
-            x[1]["active"], 
-            x[1]["upward_price"], 
-            x[1]["profit_potential"]
-        ),
+        key=lambda x: rank_key(x[1]),
         reverse=True
     )
 
@@ -109,7 +109,7 @@ def get_mean_avg_availability(price_data):
     if not price_data:
         return None
 
-    mean_value = np.mean([data_point["avg_avail"] for data_point in price_data["price_graph_data"]])
+    mean_value = np.mean(price_data.avg_avail)
 
     if mean_value > 10:
         rounded_value = round(mean_value, -1)
@@ -120,7 +120,7 @@ def get_mean_avg_availability(price_data):
 
 def get_upward_price_signals(price_data, activity_derivatives):
     # Extract the necessary data
-    avg_avails = [data_point["avg_avail"] for data_point in price_data["price_graph_data"]]
+    avg_avails = price_data.avg_avail
     avg_avail_derivative = activity_derivatives["avg_avail"]
     lowest_price_derivative = activity_derivatives["lowest_price"]
     
@@ -151,36 +151,52 @@ def get_upward_price_signals(price_data, activity_derivatives):
     return score
 
 
+def assess_market_health(price_data, item_data, type='craft'):
+    """
+    Adds the market health fields (avg_available, active, upward_price and the profit
+    potentials) of a price history to an item's data.
+
+    Returns:
+    - False when the item has no price history, True otherwise
+    """
+    item_data["avg_available"] = get_mean_avg_availability(price_data)
+    if item_data["avg_available"] is None:
+        return False
+
+    # Check market activity
+    activity_derivatives = {
+        "avg_avail": calculate_derivative(price_data.avg_avail),
+        "lowest_price": calculate_derivative(price_data.lowest_price),
+        "avg_price": calculate_derivative(price_data.avg_price)
+    }
+    item_data["active"] = 1 if is_market_active(activity_derivatives) else 0
+
+    # Check price trend
+    item_data["upward_price"] = get_upward_price_signals(price_data, activity_derivatives)
+
+    # Calculate raw profit-making potential
+    if type == 'craft':
+        item_data["profit_potential"] = calculate_profit_potential(item_data)
+
+    item_data["buy_profit_potential"] = calculate_buy_profit_potential(item_data)
+    return True
+
+
 def analyze_market_health(session, server_id, items_dict, type='craft'):
     """Main function to analyze and rank items based on market health."""
     
     items_to_remove = []
 
+    # Fetch every missing price history up front instead of one request per loop iteration
+    prefetch_price_data(session, items_dict.keys(), server_id)
+
     for item_id, item_data in items_dict.items():
         # Extract data from cache
         price_data = get_price_data(session, item_id, server_id)
 
-        item_data["avg_available"] = get_mean_avg_availability(price_data)
-        if item_data["avg_available"] is None:
+        # Remove items without a price history
+        if not assess_market_health(price_data, item_data, type):
             items_to_remove.append(item_id)
-            continue
-        
-        # Check market activity
-        activity_derivatives = {
-            "avg_avail": calculate_derivative([data_point["avg_avail"] for data_point in price_data["price_graph_data"]]),
-            "lowest_price": calculate_derivative([data_point["lowest_price"] for data_point in price_data["price_graph_data"]]),
-            "avg_price": calculate_derivative([data_point["avg_price"] for data_point in price_data["price_graph_data"]])
-        }
-        item_data["active"] = 1 if is_market_active(activity_derivatives) else 0
-
-        # Check price trend
-        item_data["upward_price"] = get_upward_price_signals(price_data, activity_derivatives)
-
-        # Calculate raw profit-making potential
-        if type == 'craft':
-            item_data["profit_potential"] = calculate_profit_potential(item_data)
-
-        item_data["buy_profit_potential"] = calculate_buy_profit_potential(item_data)
 
     # Remove items where avg_available is None
     for item_id in items_to_remove:
@@ -193,3 +209,81 @@ def analyze_market_health(session, server_id, items_dict, type='craft'):
         ranked_items_dict = rank_buy_items(items_dict)
 
     return ranked_items_dict
+
+
+def estimated_profit_potential(item_data):
+    """Profit potential of a crafted item at its current availability, before its price history is known."""
+    return item_data["Profit"] * item_data["Availability"]
+
+
+def stream_market_health(session, server_id, items_dict, assessed=(), top_k=STREAM_TOP_K, callback=None):
+    """
+    Generator version of analyze_market_health for crafted items, yielding the top_k as
+    the items are analyzed. The items already assessed are ranked first; the others are
+    analyzed by decreasing estimated_profit_potential, in batches whose missing price
+    histories are prefetched together, so the likely best come in early. Nothing is
+    skipped: the rank depends on the average availability over the price history, which
+    is only known once the history is.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_id: ID of the server the items are sold on
+    - items_dict: Profitability dictionaries by item_id, in evaluation order; the items
+      without a price history are removed from it, like analyze_market_health does
+    - assessed: item_ids of items_dict that already carry their market health fields
+    - top_k: Number of items to rank
+    - callback: Progress callback, called with the number of items analyzed and the total
+
+    Yields:
+    - The current top_k, ranked like rank_items, at most every STREAM_UPDATE_INTERVAL seconds
+      and once more at the end
+
+    Returns:
+    - Dictionary with the number of items, analyzed, histories fetched and the elapsed seconds
+    """
+    start_time = time.perf_counter()
+    assessed = set(assessed)
+    stats = {"items": len(items_dict), "analyzed": len(items_dict) - len(assessed), "fetched": 0}
+    # Min-heap of (rank_key, -evaluation order, item_id), the worst of the top on top
+    heap = []
+    order = {item_id: position for position, item_id in enumerate(items_dict)}
+
+    def push(item_id):
+        entry = (rank_key(items_dict[item_id]), -order[item_id], item_id)
+        if len(heap) < top_k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    def ranking():
+        return {item_id: items_dict[item_id] for _, _, item_id in sorted(heap, reverse=True)}
+
+    for item_id in assessed:
+        push(item_id)
+    if heap:
+        yield ranking()
+
+    candidates = sorted(
+        (item_id for item_id in items_dict if item_id not in assessed),
+        key=lambda item_id: estimated_profit_potential(items_dict[item_id]), reverse=True
+    )
+    last_update = time.perf_counter()
+    for start in range(0, len(candidates), PRICE_HISTORY_WORKERS):
+        batch = candidates[start:start + PRICE_HISTORY_WORKERS]
+        stats["fetched"] += prefetch_price_data(session, batch, server_id)["fetched"]
+
+        for item_id in batch:
+            if assess_market_health(get_price_data(session, item_id, server_id), items_dict[item_id]):
+                push(item_id)
+            else:
+                del items_dict[item_id]
+
+        if callback:
+            callback(start + len(batch), len(candidates))
+        if time.perf_counter() - last_update >= STREAM_UPDATE_INTERVAL:
+            last_update = time.perf_counter()
+            yield ranking()
+
+    stats["elapsed"] = time.perf_counter() - start_time
+    yield ranking()
+    return stats
@@ -0,0 +1,165 @@
+#benchmark/load_test.py
+
+"""
+Runs the refresh-and-analyze pipeline offline against the stand-in server and a
+throwaway database, and prints how long each stage took.
+
+    python -m benchmark.load_test --items 5000 --recipes 300 --servers 4 --latency 0.3
+
+The database is built from a seeded synthetic catalog and recipe graph, so two runs
+with the same arguments do the same work.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmark.stand_in_server import StandInConfig, StandInServer, synthetic_catalog
+
+
+def build_synthetic_database(session, catalog, servers, recipe_count, seed=0):
+    """
+    Fills an empty database with servers, trade skills, the catalog items, a few item
+    types and a layered recipe graph where every recipe only uses earlier items.
+    Returns the player_id of a benchmark character on the first server.
+    """
+    from database.init_db import load_trade_skills
+    from database.models import (CraftingRecipe, Item, ItemType, Player, PlayerSkill, RecipeReagent,
+                                 RecipeSkillRequirement, Server, TradeSkill)
+
+    rnd = random.Random(seed)
+
+    for server in servers:
+        session.add(Server(**server))
+    load_trade_skills(session)
+    session.flush()
+    skills = session.query(TradeSkill).all()
+
+    for item_id, nw_market_id in catalog:
+        session.add(Item(item_id=item_id, item_name=item_id, nw_market_id=nw_market_id))
+    session.flush()
+
+    # Raw materials are the first items; recipes produce later items out of earlier ones
+    raw_count = max(len(catalog) - recipe_count, len(catalog) // 3)
+    raw_ids = [item_id for item_id, _ in catalog[:raw_count]]
+
+    item_types = []
+    for index in range(5):
+        item_type = ItemType(item_type_name=f"synthetic_type_{index}")
+        item_type.items = [session.get(Item, item_id) for item_id in rnd.sample(raw_ids, min(5, len(raw_ids)))]
+        session.add(item_type)
+        item_types.append(item_type)
+    session.flush()
+
+    for index in range(raw_count, min(len(catalog), raw_count + recipe_count)):
+        recipe = CraftingRecipe(result_item_id=catalog[index][0], quantity_produced=rnd.choice([1, 1, 1, 2, 5]))
+        session.add(recipe)
+        session.flush()
+        session.add(RecipeSkillRequirement(recipe_id=recipe.recipe_id, skill_id=rnd.choice(skills).skill_id,
+                                           level_required=rnd.randint(0, 200)))
+        for reagent_id in rnd.sample([item_id for item_id, _ in catalog[:index]], rnd.randint(2, 3)):
+            session.add(RecipeReagent(recipe_id=recipe.recipe_id, reagent_item_id=reagent_id,
+                                      quantity_required=rnd.randint(1, 3)))
+        if rnd.random() < 0.2:
+            session.add(RecipeReagent(recipe_id=recipe.recipe_id, reagent_item_type_id=rnd.choice(item_types).item_type_id,
+                                      quantity_required=rnd.randint(1, 2)))
+
+    player = Player(player_name="Benchmark", server_id=servers[0]["server_id"])
+    session.add(player)
+    session.flush()
+    for skill in skills:
+        session.add(PlayerSkill(player_id=player.player_id, skill_id=skill.skill_id, skill_level=150))
+    session.commit()
+    return player.player_id
+
+
+def run(args):
+    config = StandInConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, items=args.items,
+                           history_days=args.history_days, change_fraction=args.change_fraction, seed=args.seed,
+                           fixtures_dir=args.fixtures)
+    catalog = synthetic_catalog(args.items, args.seed)
+    stand_in = StandInServer(config, catalog=catalog)
+    base_url = stand_in.start()
+
+    work_dir = tempfile.mkdtemp(prefix="nwpc_load_test_")
+    # These settings are read when the project modules are first imported
+    os.environ["NWMP_BASE_URL"] = base_url
+    os.environ["NWPC_DATABASE_PATH"] = os.path.join(work_dir, "load_test.sqlite")
+    os.environ["NWPC_SNAPSHOT_ARCHIVE_DIR"] = os.path.join(work_dir, "snapshots")
+    os.chdir(work_dir)
+
+    from sqlalchemy.orm import sessionmaker
+    from analysis.buy_profit import BuyProfitAnalyzer
+    from analysis.crafting_profit import CraftingProfitAnalyzer
+    from data_input.http_client import get_client
+    from data_input.refresh import refresh_all_servers
+    from database.models import engine
+
+    timings = {}
+    session = sessionmaker(bind=engine)()
+    servers = [{"server_name": f"Server {index}", "server_id": str(100 + index)} for index in range(args.servers)]
+
+    start_time = time.perf_counter()
+    player_id = build_synthetic_database(session, catalog, servers, args.recipes, args.seed)
+    timings["build database"] = time.perf_counter() - start_time
+
+    for label in ("first refresh", "second refresh"):
+        report = refresh_all_servers(session, servers=servers, max_workers=args.workers)
+        timings[label] = report["elapsed"]
+        for server_name, server_report in report["servers"].items():
+            if "error" in server_report:
+                print(f"  {label} {server_name}: {server_report['error']}")
+                continue
+            stats = server_report["stats"]
+            print(f"  {label} {server_name}: download {server_report['download_seconds']:.2f}s, "
+                  f"ingest {server_report['ingest_seconds']:.2f}s, {stats['inserted']} logged, "
+                  f"{stats['unchanged']} unchanged")
+
+    if not args.skip_analysis:
+        server_id = servers[0]["server_id"]
+        start_time = time.perf_counter()
+        crafting_results = CraftingProfitAnalyzer(session, server_id, player_id).evaluate_all_recipes()
+        timings["evaluate all recipes"] = time.perf_counter() - start_time
+        print(f"  {len(crafting_results)} profitable recipes")
+
+        start_time = time.perf_counter()
+        buy_results = BuyProfitAnalyzer(session, server_id, player_id).evaluate_all_buy_prices()
+        timings["evaluate all buys"] = time.perf_counter() - start_time
+        print(f"  {len(buy_results)} buy opportunities")
+
+    session.close()
+    stand_in.stop()
+
+    print("Timings:")
+    for label, seconds in timings.items():
+        print(f"  {label}: {seconds:.2f}s")
+    print("HTTP:")
+    for endpoint, stats in get_client().get_stats().items():
+        print(f"  {endpoint}: {stats['requests']} requests, {stats['not_modified']} not modified, {stats['errors']} errors, "
+              f"{stats['bytes']} bytes, {stats['avg_seconds'] * 1000:.1f}ms average")
+    print(f"Stand-in served {stand_in.request_count} requests, work directory {work_dir}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the refresh-and-analyze pipeline")
+    parser.add_argument("--items", type=int, default=2000, help="Items in the synthetic catalog")
+    parser.add_argument("--recipes", type=int, default=100, help="Crafting recipes in the synthetic database")
+    parser.add_argument("--servers", type=int, default=2, help="Number of servers to refresh")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent downloads during a refresh")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--history-days", type=int, default=30, help="Points in each price history")
+    parser.add_argument("--change-fraction", type=float, default=0.05,
+                        help="Fraction of prices that move between the two refreshes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", help="Directory of recorded fixtures to serve first")
+    parser.add_argument("--skip-analysis", action="store_true", help="Only time the refreshes")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
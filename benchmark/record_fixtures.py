@@ -0,0 +1,64 @@
+#benchmark/record_fixtures.py
+
+"""
+Records live nwmarketprices responses into a fixture directory that
+stand_in_server.py can replay.
+
+    python -m benchmark.record_fixtures --out fixtures --server 49 --history-items 200
+"""
+
+import argparse
+import json
+import os
+import time
+import requests
+from data_input.http_client import get_client
+
+
+def record(out_dir, server_ids, history_items=0, delay=1.0):
+    """
+    Saves the latest prices of each server, the confirmed item names and, for the first
+    history_items items of the database, their price histories. Waits delay seconds
+    between price history requests to stay polite with the site.
+    """
+    client = get_client()
+    os.makedirs(os.path.join(out_dir, "latest-prices"), exist_ok=True)
+
+    names = client.fetch_json("confirmed-names", "/api/confirmed_names/")
+    with open(os.path.join(out_dir, "confirmed_names.json"), "w") as f:
+        json.dump(names, f)
+
+    for server_id in server_ids:
+        client.download_to_file("latest-prices", f"/api/latest-prices/{server_id}/",
+                                os.path.join(out_dir, "latest-prices", f"{server_id}.json"))
+
+        if not history_items:
+            continue
+        history_dir = os.path.join(out_dir, "history", str(server_id))
+        os.makedirs(history_dir, exist_ok=True)
+        market_ids = [details["name_id"] for details in names.values()][:history_items]
+        for nw_market_id in market_ids:
+            try:
+                data = client.fetch_json("price-history", f"/0/{server_id}/?cn_id={nw_market_id}")
+            except requests.RequestException as e:
+                print(f"Skipping history of {nw_market_id}: {e}")
+                continue
+            with open(os.path.join(history_dir, f"{nw_market_id}.json"), "w") as f:
+                json.dump(data, f)
+            time.sleep(delay)
+
+    print(f"Fixtures saved to {out_dir}: {client.get_stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record nwmarketprices responses as stand-in fixtures")
+    parser.add_argument("--out", required=True, help="Fixture directory to write")
+    parser.add_argument("--server", action="append", required=True, help="Server ID, can be repeated")
+    parser.add_argument("--history-items", type=int, default=0, help="Number of price histories to record per server")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between price history requests")
+    args = parser.parse_args()
+    record(args.out, args.server, args.history_items, args.delay)
+
+
+if __name__ == "__main__":
+    main()
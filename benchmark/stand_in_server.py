@@ -0,0 +1,273 @@
+#benchmark/stand_in_server.py
+
+"""
+Local stand-in for the parts of nwmarketprices.com used by data_downloader and
+cache_operations, for offline and reproducible benchmarks.
+
+Serves:
+- /api/latest-prices/{server_id}/
+- /0/{server_id}/?cn_id={nw_market_id}
+- /api/confirmed_names/
+
+Responses come from recorded fixtures (see record_fixtures.py) when a fixture
+directory is given and holds the requested file, otherwise they are generated
+from a seeded catalog. Latency, error rate and payload size are configurable.
+
+Run it with:
+    python -m benchmark.stand_in_server --port 8765 --items 5000 --latency 0.2
+and point the application at it with NWMP_BASE_URL=http://127.0.0.1:8765
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandInConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, items=2000, history_days=30,
+                 change_fraction=0.0, seed=0, fixtures_dir=None):
+        self.latency = latency  # Seconds added to every response
+        self.jitter = jitter  # Random extra seconds, up to this much
+        self.error_rate = error_rate  # Fraction of requests answered with 503
+        self.items = items  # Number of items in a synthetic catalog
+        self.history_days = history_days  # Points in each synthetic price history
+        self.change_fraction = change_fraction  # Fraction of prices that move on each latest-prices request
+        self.seed = seed
+        self.fixtures_dir = fixtures_dir
+
+
+def synthetic_catalog(size, seed=0):
+    """Returns a list of (item_id, nw_market_id) pairs for a made up catalog."""
+    return [(f"synthetic_item_{index}", seed * 1000000 + index + 1) for index in range(size)]
+
+
+def catalog_from_database(database_path):
+    """Returns the (item_id, nw_market_id) pairs of the items table of an existing database."""
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    try:
+        return [tuple(row) for row in connection.execute(
+            "SELECT item_id, nw_market_id FROM items WHERE nw_market_id IS NOT NULL"
+        )]
+    finally:
+        connection.close()
+
+
+class StandInServer:
+    """
+    Threaded HTTP server answering with fixture or synthetic payloads.
+    Use start()/stop() to run it in the background, or serve_forever().
+    """
+
+    def __init__(self, config=None, catalog=None, host="127.0.0.1", port=0):
+        self.config = config or StandInConfig()
+        self.catalog = catalog if catalog is not None else synthetic_catalog(self.config.items, self.config.seed)
+        self.names_by_market_id = {nw_market_id: item_id for item_id, nw_market_id in self.catalog}
+        self._generation = {}  # server_id -> number of latest-prices requests served
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    # --- payloads ---
+
+    def _load_fixture(self, *parts):
+        if not self.config.fixtures_dir:
+            return None
+        path = os.path.join(self.config.fixtures_dir, *parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def latest_prices(self, server_id):
+        fixture = self._load_fixture("latest-prices", f"{server_id}.json")
+        if fixture is not None:
+            return fixture
+
+        with self._lock:
+            generation = self._generation.get(server_id, 0)
+            self._generation[server_id] = generation + 1
+
+        last_updated = datetime(2023, 10, 1, 12, 0, 0)
+        items = []
+        for index, (item_id, _) in enumerate(self.catalog):
+            rnd = random.Random(f"{self.config.seed}:{server_id}:{item_id}")
+            # Later catalog items are pricier, so items crafted from earlier ones can turn a profit
+            price = round((1 + 50 * index / len(self.catalog)) * rnd.uniform(0.5, 1.5), 2)
+            availability = rnd.randint(0, 2000)
+            updated = last_updated
+            changes = rnd.random() < self.config.change_fraction
+            # Move a stable subset of the prices on every new generation
+            if generation and changes:
+                price = round(price * (1 + 0.01 * generation), 2)
+                availability += generation
+                updated = last_updated + timedelta(minutes=generation)
+            items.append({
+                "ItemId": item_id,
+                "Price": price,
+                "Availability": availability,
+                "LastUpdated": updated.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                "HighestBuyOrder": round(price * rnd.uniform(0.3, 0.9), 2) if rnd.random() < 0.6 else None,
+                "Qty": rnd.randint(1, 500) if rnd.random() < 0.6 else None,
+            })
+        return json.dumps(items).encode("utf-8")
+
+    def price_history(self, server_id, nw_market_id):
+        fixture = self._load_fixture("history", str(server_id), f"{nw_market_id}.json")
+        if fixture is not None:
+            return fixture
+
+        item_id = self.names_by_market_id.get(nw_market_id)
+        if item_id is None:
+            return None
+
+        rnd = random.Random(f"{self.config.seed}:{server_id}:{nw_market_id}:history")
+        start = datetime(2023, 10, 1) - timedelta(days=self.config.history_days)
+        price = rnd.uniform(0.1, 500.0)
+        points = []
+        window = []
+        for day in range(self.config.history_days):
+            price = max(0.01, price * rnd.uniform(0.9, 1.1))
+            lowest = price * rnd.uniform(0.8, 1.0)
+            window = (window + [price])[-7:]
+            points.append({
+                "date_only": (start + timedelta(days=day)).strftime("%Y-%m-%d"),
+                "avg_price": round(price, 2),
+                "lowest_price": round(lowest, 2),
+                "avg_avail": rnd.randint(0, 1000),
+                "rolling_average": round(sum(window) / len(window), 2),
+            })
+        return json.dumps({"item_name": item_id, "price_graph_data": points}).encode("utf-8")
+
+    def confirmed_names(self):
+        fixture = self._load_fixture("confirmed_names.json")
+        if fixture is not None:
+            return fixture
+        return json.dumps({
+            item_id: {"nwdb_id": item_id, "name": item_id, "name_id": nw_market_id}
+            for item_id, nw_market_id in self.catalog
+        }).encode("utf-8")
+
+    def route(self, path):
+        """Returns the body for a request path, or None for a 404."""
+        url = urlparse(path)
+        parts = [part for part in url.path.split("/") if part]
+        if len(parts) == 3 and parts[:2] == ["api", "latest-prices"]:
+            return self.latest_prices(parts[2])
+        if len(parts) == 2 and parts[:1] == ["api"] and parts[1] == "confirmed_names":
+            return self.confirmed_names()
+        if len(parts) == 2 and parts[0] == "0":
+            cn_id = parse_qs(url.query).get("cn_id", [None])[0]
+            try:
+                return self.price_history(parts[1], int(cn_id))
+            except (TypeError, ValueError):
+                return None
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server._lock:
+                    server.request_count += 1
+
+                delay = server.config.latency + random.uniform(0, server.config.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                if random.random() < server.config.error_rate:
+                    self._send(503, b"")
+                    return
+
+                body = server.route(self.path)
+                if body is None:
+                    self._send(404, b"")
+                    return
+
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", {"ETag": etag})
+                    return
+
+                headers = {"ETag": etag, "Content-Type": "application/json"}
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=5)
+                    headers["Content-Encoding"] = "gzip"
+                self._send(200, body, headers)
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local nwmarketprices stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--items", type=int, default=2000, help="Size of the synthetic catalog")
+    parser.add_argument("--history-days", type=int, default=30, help="Points in each synthetic price history")
+    parser.add_argument("--change-fraction", type=float, default=0.0,
+                        help="Fraction of prices that move on each latest-prices request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", help="Directory of recorded fixtures to serve first")
+    parser.add_argument("--catalog-db", help="Take the synthetic catalog from the items table of this database")
+    args = parser.parse_args()
+
+    config = StandInConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, items=args.items,
+        history_days=args.history_days, change_fraction=args.change_fraction, seed=args.seed,
+        fixtures_dir=args.fixtures
+    )
+    catalog = catalog_from_database(args.catalog_db) if args.catalog_db else None
+    server = StandInServer(config, catalog=catalog, host=args.host, port=args.port)
+    print(f"Serving {len(server.catalog)} items on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
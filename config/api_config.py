@@ -0,0 +1,22 @@
+#config/api_config.py
+import os
+
+# Base URL of NW Market Prices, can be pointed at a local stand-in for offline runs
+API_BASE_URL = os.environ.get("NWMP_BASE_URL", "https://nwmarketprices.com").rstrip("/")
+
+# Seconds to wait for a connection or a response chunk before giving up
+API_TIMEOUT = 60
+
+# Number of keep-alive connections kept open to the API
+API_POOL_SIZE = 8
+
+# Retries for connection errors and 429/5xx responses, with exponential backoff
+API_RETRIES = 3
+API_BACKOFF_FACTOR = 0.5
+
+# Price history requests per second across all threads, and how many may go out back to back
+PRICE_HISTORY_RATE = 2.0
+PRICE_HISTORY_BURST = 4
+
+# Concurrent price history downloads when prefetching
+PRICE_HISTORY_WORKERS = 4
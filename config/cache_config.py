@@ -0,0 +1,15 @@
+#config/cache_config.py
+
+# Seconds a cached price history stays fresh before it is downloaded again
+PRICE_HISTORY_TTL = 12 * 60 * 60
+
+# Price histories kept in memory in front of the api_cache table, least recently used dropped first
+MEMORY_CACHE_SIZE = 1024
+
+# Seconds a history is served from memory without checking the table, which other
+# processes may have invalidated; never longer than PRICE_HISTORY_TTL
+MEMORY_CACHE_TTL = 10 * 60
+
+# Price histories prefetched after a refresh when cache warming is on, the most profitable first
+WARM_CACHE_MAX_ITEMS = 1000
+WARM_CACHE_BATCH_SIZE = 50
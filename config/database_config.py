@@ -4,8 +4,11 @@ import os
 # The base directory of your project
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-# Path to the SQLite database
-DATABASE_PATH = os.path.join(BASE_DIR, "new_world_profit_calculator_db.sqlite")
+# Path to the SQLite database, NWPC_DATABASE_PATH points it elsewhere (e.g. for benchmarks)
+DATABASE_PATH = os.environ.get("NWPC_DATABASE_PATH", os.path.join(BASE_DIR, "new_world_profit_calculator_db.sqlite"))
 
 # Connection URI for SQLite
 DATABASE_URI = f"sqlite:///{DATABASE_PATH}"
+
+# Directory of the compressed archive of every downloaded price snapshot
+SNAPSHOT_ARCHIVE_DIR = os.environ.get("NWPC_SNAPSHOT_ARCHIVE_DIR", os.path.join(BASE_DIR, "snapshots"))
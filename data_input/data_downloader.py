@@ -1,23 +1,116 @@
 import os
-import requests
 import json
+from data_input.http_client import get_client, validators_filename
+
+# Size of the pieces the HTTP body is written and parsed in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Number of items handed to the ingest stage at a time
+DEFAULT_BATCH_SIZE = 1000
 
 def delete_old_data_file(filename='download.json'):
-    if os.path.exists(filename):
-        os.remove(filename)
+    for path in (filename, validators_filename(filename)):
+        if os.path.exists(path):
+            os.remove(path)
 
 def download_data(server_id):
-    url = f'https://nwmarketprices.com/api/latest-prices/{server_id}/'
-    response = requests.get(url)
-    response.raise_for_status()  # Check for a valid response
-    data = response.json()
-    return data
+    # Raises requests.HTTPError for an invalid response
+    return get_client().fetch_json('latest-prices', f'/api/latest-prices/{server_id}/')
+
+def download_data_to_file(server_id, filename='download.json'):
+    """
+    Streams the latest-prices payload of a server straight to disk without
+    decoding it, so the snapshot is never held in memory. If the server reports
+    the payload unchanged since the last download, the file is left as it is.
+    """
+    get_client().download_to_file('latest-prices', f'/api/latest-prices/{server_id}/', filename, chunk_size=STREAM_CHUNK_SIZE)
+    return filename
 
 def save_data_to_file(data, filename='download.json'):
-    delete_old_data_file(filename)  
+    delete_old_data_file(filename)
     with open(filename, 'w') as f:
         json.dump(data, f)
 
 def load_data_from_file(filename='download.json'):
     with open(filename, 'r') as f:
         return json.load(f)
+
+def iter_json_items(source, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Incrementally parses a JSON array, yielding its elements one at a time.
+    Only the current chunk and the element being decoded are kept in memory.
+
+    Args:
+    - source: Path of the file, or an open text file object
+    - chunk_size: Number of characters read per chunk
+    """
+    f = open(source, 'r', encoding='utf-8') if isinstance(source, (str, os.PathLike)) else source
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def skip_whitespace():
+        nonlocal pos
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+
+    try:
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                if eof:
+                    raise ValueError("Unexpected end of JSON array")
+                # Everything in the buffer has been consumed, replace it with the next chunk
+                buffer = f.read(chunk_size)
+                pos = 0
+                if not buffer:
+                    eof = True
+                continue
+
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == ']':
+                return
+            if buffer[pos] == ',':
+                pos += 1
+                continue
+
+            try:
+                # Elements are JSON objects, so a truncated element always fails to decode
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    eof = True
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            pos = end
+            yield item
+    finally:
+        if f is not source:
+            f.close()
+
+def iter_item_batches(source, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Groups the items of a downloaded snapshot into lists of at most batch_size
+    items for the ingest stage.
+    """
+    batch = []
+    for item in iter_json_items(source):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
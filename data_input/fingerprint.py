@@ -0,0 +1,39 @@
+#data_input/fingerprint.py
+
+import hashlib
+import json
+from data_input.data_downloader import iter_json_items
+
+# Fields of a latest-prices item that decide whether it changed since the last snapshot
+ITEM_FINGERPRINT_FIELDS = ("Price", "Availability", "LastUpdated", "HighestBuyOrder", "Qty")
+
+
+def fingerprint_item(item_data):
+    """Returns a short hash of the price fields of one latest-prices item."""
+    values = [item_data.get(field) for field in ITEM_FINGERPRINT_FIELDS]
+    encoded = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def fingerprint_payload(json_data):
+    """Returns a content hash of a whole latest-prices payload already loaded in memory."""
+    return hashlib.sha256(_canonical(json_data)).hexdigest()
+
+
+def fingerprint_file(filename):
+    """
+    Returns the content hash of a downloaded snapshot file, the same fingerprint_payload
+    gives for its decoded JSON, whatever its formatting. The array is hashed one item at
+    a time, so the snapshot is never fully in memory.
+    """
+    digest = hashlib.sha256(b'[')
+    for index, item in enumerate(iter_json_items(filename)):
+        if index:
+            digest.update(b',')
+        digest.update(_canonical(item))
+    digest.update(b']')
+    return digest.hexdigest()
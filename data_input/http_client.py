@@ -0,0 +1,236 @@
+#data_input/http_client.py
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config.api_config import API_BASE_URL, API_BACKOFF_FACTOR, API_POOL_SIZE, API_RETRIES, API_TIMEOUT
+
+# Number of decoded JSON bodies kept to answer 304 Not Modified responses
+MAX_CACHED_BODIES = 1024
+
+
+def validators_filename(filename):
+    """File next to a download_to_file target recording the URL and validators of the body it holds."""
+    return f"{filename}.validators"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter: acquire() blocks until a token is available.
+    Tokens refill at rate per second, up to capacity.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class MarketPricesClient:
+    """
+    Shared HTTP client for every nwmarketprices call. Keeps connections alive in a pool,
+    asks for gzip, retries with backoff, revalidates with ETag/If-Modified-Since and
+    counts requests, bytes and latency per endpoint. Safe to use from several threads.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, pool_size=API_POOL_SIZE, retries=API_RETRIES,
+                 backoff_factor=API_BACKOFF_FACTOR, timeout=API_TIMEOUT):
+        self.base_url = base_url
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+        self._lock = threading.Lock()
+        self._validators = {}  # url -> {"ETag": ..., "Last-Modified": ...}
+        self._bodies = OrderedDict()  # url -> decoded JSON of the last 200 response
+        self._stats = {}
+
+    def _record(self, endpoint, seconds, bytes_received=0, not_modified=False, error=False):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {
+                "requests": 0, "not_modified": 0, "errors": 0, "bytes": 0, "seconds": 0.0, "max_seconds": 0.0
+            })
+            stats["requests"] += 1
+            stats["not_modified"] += int(not_modified)
+            stats["errors"] += int(error)
+            stats["bytes"] += bytes_received
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def get_stats(self):
+        """Returns a copy of the per-endpoint counters, with the average latency added."""
+        with self._lock:
+            return {
+                endpoint: dict(stats, avg_seconds=stats["seconds"] / stats["requests"] if stats["requests"] else 0.0)
+                for endpoint, stats in self._stats.items()
+            }
+
+    def _conditional_headers(self, url):
+        with self._lock:
+            validators = self._validators.get(url, {})
+        headers = {}
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+        return headers
+
+    def _store_validators(self, url, response):
+        validators = {key: response.headers[key] for key in ("ETag", "Last-Modified") if key in response.headers}
+        with self._lock:
+            if validators:
+                self._validators[url] = validators
+            else:
+                self._validators.pop(url, None)
+
+    def fetch_json(self, endpoint, path):
+        """
+        GETs path and returns the decoded JSON body. A 304 Not Modified is answered from
+        the body of the previous response. Raises requests.HTTPError for error statuses.
+
+        Args:
+        - endpoint: Name the counters are kept under, e.g. "latest-prices"
+        - path: Path and query string relative to the base URL
+        """
+        url = f"{self.base_url}{path}"
+        with self._lock:
+            has_body = url in self._bodies
+        headers = self._conditional_headers(url) if has_body else {}
+
+        start_time = time.perf_counter()
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            self._record(endpoint, time.perf_counter() - start_time, error=True)
+            raise
+
+        if response.status_code == 304:
+            with self._lock:
+                data = self._bodies.get(url)
+                if data is not None:
+                    self._bodies.move_to_end(url)
+            if data is not None:
+                self._record(endpoint, time.perf_counter() - start_time, not_modified=True)
+                return data
+            # The body was evicted meanwhile, ask again without validators
+            with self._lock:
+                self._validators.pop(url, None)
+            return self.fetch_json(endpoint, path)
+
+        if response.status_code != 200:
+            self._record(endpoint, time.perf_counter() - start_time, len(response.content), error=True)
+            response.raise_for_status()
+            raise requests.HTTPError(f"Unexpected status {response.status_code} for url: {url}", response=response)
+
+        data = response.json()
+        self._record(endpoint, time.perf_counter() - start_time, len(response.content))
+        self._store_validators(url, response)
+        with self._lock:
+            self._bodies[url] = data
+            self._bodies.move_to_end(url)
+            while len(self._bodies) > MAX_CACHED_BODIES:
+                self._bodies.popitem(last=False)
+        return data
+
+    def _file_headers(self, url, filename):
+        """Conditional headers for url, only when filename holds the last body of that very url."""
+        try:
+            with open(validators_filename(filename)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if saved.get("url") != url or not os.path.exists(filename):
+            return {}
+        headers = {}
+        if "ETag" in saved:
+            headers["If-None-Match"] = saved["ETag"]
+        if "Last-Modified" in saved:
+            headers["If-Modified-Since"] = saved["Last-Modified"]
+        return headers
+
+    def download_to_file(self, endpoint, path, filename, chunk_size=64 * 1024):
+        """
+        Streams the body of path straight to filename. When filename already holds the
+        previous response of the same URL, as recorded in its validators_filename, the
+        request is conditional and a 304 leaves the file untouched. Raises
+        requests.HTTPError for error statuses.
+
+        Returns:
+        - True if a new body was written, False if the server answered 304 Not Modified
+        """
+        url = f"{self.base_url}{path}"
+        headers = self._file_headers(url, filename)
+
+        start_time = time.perf_counter()
+        bytes_received = 0
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304:
+                    self._record(endpoint, time.perf_counter() - start_time, not_modified=True)
+                    return False
+                response.raise_for_status()
+
+                # Write to a temporary file first so a failed download never replaces the last good one
+                partial_filename = f"{filename}.part"
+                with open(partial_filename, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        bytes_received += len(chunk)
+                # Forget what the file held before replacing it, then record what it holds now
+                if os.path.exists(validators_filename(filename)):
+                    os.remove(validators_filename(filename))
+                os.replace(partial_filename, filename)
+                validators = {key: response.headers[key] for key in ("ETag", "Last-Modified") if key in response.headers}
+                if validators:
+                    with open(validators_filename(filename), "w") as f:
+                        json.dump(dict(validators, url=url), f)
+        except (requests.RequestException, OSError):
+            self._record(endpoint, time.perf_counter() - start_time, bytes_received, error=True)
+            raise
+
+        self._record(endpoint, time.perf_counter() - start_time, bytes_received)
+        return True
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the process-wide MarketPricesClient, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = MarketPricesClient()
+        return _client
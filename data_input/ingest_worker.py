@@ -0,0 +1,66 @@
+#data_input/ingest_worker.py
+
+import queue
+import threading
+from sqlalchemy.orm import sessionmaker
+from database.models import engine
+
+Session = sessionmaker(bind=engine)
+
+
+class IngestCancelled(Exception):
+    """Raised from a progress callback once the job has been cancelled."""
+
+
+class IngestWorker:
+    """
+    Runs a refresh job (see data_input/refresh.py), or any job with the same signature
+    such as crafting_profit.stream_recipes_job, on a background thread with its own
+    database session, so the Tk main loop stays responsive.
+
+    The job is called as job(session, *args, callback=..., **kwargs). Each time it reports
+    progress through the callback, a ("progress", message) event is queued, and once
+    cancel() was called the callback raises IngestCancelled instead. Whatever the job
+    had not committed is rolled back, so its results only become visible to other
+    sessions when it commits.
+
+    The thread finishes with one of ("done", result), ("cancelled", None) or
+    ("error", exception) on the events queue, which the UI polls from its own thread.
+    """
+
+    def __init__(self, job, *args, **kwargs):
+        self.job = job
+        self.args = args
+        self.kwargs = kwargs
+        self.events = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def progress(self, message):
+        if self._cancel_event.is_set():
+            raise IngestCancelled()
+        self.events.put(("progress", message))
+
+    def _run(self):
+        session = Session()
+        try:
+            result = self.job(session, *self.args, callback=self.progress, **self.kwargs)
+            self.events.put(("done", result))
+        except IngestCancelled:
+            session.rollback()
+            self.events.put(("cancelled", None))
+        except Exception as e:
+            session.rollback()
+            self.events.put(("error", e))
+        finally:
+            session.close()
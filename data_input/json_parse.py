@@ -1,41 +1,111 @@
 #data_input/json_parse.py
 
+import time
 from datetime import datetime
-from database.operations import current_price_operations, price_log_operations
+from data_input.fingerprint import fingerprint_item, fingerprint_payload
+from database.operations import current_price_operations, fingerprint_operations, item_operations, price_log_operations
+
+
+def parse_item_data(item_data, server_id):
+    """
+    Converts one item entry of the latest-prices payload into the column values
+    shared by PriceLog and CurrentPrice.
+    """
+    return {
+        "item_id": item_data["ItemId"],
+        "price": float(item_data["Price"]),
+        "availability": item_data["Availability"],
+        # Convert the string representation of the datetime to a datetime object
+        "last_updated": datetime.strptime(item_data["LastUpdated"], "%Y-%m-%dT%H:%M:%S.%f"),
+        "highest_buy_order": item_data["HighestBuyOrder"] if item_data["HighestBuyOrder"] else None,
+        "qty": item_data["Qty"] if item_data["Qty"] else None,
+        "server_id": server_id
+    }
+
 
 def process_json_data(session, json_data, server_id):
     """
     Processes the given JSON data and updates both PriceLog and CurrentPrice tables.
-    
+    The whole snapshot is loaded in one transaction: PriceLog duplicates are filtered
+    with a single set-based query and CurrentPrice is written with a single upsert.
+    Snapshots identical to the last one ingested for the server are skipped, and
+    otherwise only the items whose price fields changed are written.
+
     Args:
     - session: The SQLAlchemy session
     - json_data: List of dictionaries containing item price data
     - server_id: ID of the server for which the data is being processed
+
+    Returns:
+    - Dictionary with the inserted, skipped, updated and unchanged counts, the IDs of the
+      items whose current price changed and the elapsed seconds
     """
-    
-    for item_data in json_data:
-        # Extract necessary details
-        item_id = item_data["ItemId"]
-        # Convert the string representation of the datetime to a datetime object
-        last_updated = datetime.strptime(item_data["LastUpdated"], "%Y-%m-%dT%H:%M:%S.%f")
-        
-        log_data = {
-            "price": float(item_data["Price"]),
-            "availability": item_data["Availability"],
-            "last_updated": last_updated,
-            "highest_buy_order": item_data["HighestBuyOrder"] if item_data["HighestBuyOrder"] else None,
-            "qty": item_data["Qty"] if item_data["Qty"] else None,
-            "server_id": server_id  
-        }
-        
-        # Add entry to PriceLog
-        price_log_operations.add_price_log_entry(session, item_id, log_data)
-        
-        # Check if item exists in CurrentPrice
-        current_price_entry = current_price_operations.get_current_price(session, item_id, server_id)
-        if current_price_entry:
-            # Update the existing entry
-            current_price_operations.update_current_price(session, item_id, log_data)
-        else:
-            # Add new entry
-            current_price_operations.add_current_price(session, item_id, log_data)
+    return process_json_batches(session, [json_data], server_id, content_hash=fingerprint_payload(json_data))
+
+
+def process_json_batches(session, batches, server_id, content_hash=None, force=False, callback=None):
+    """
+    Same as process_json_data, but consumes the snapshot as an iterable of item
+    lists (see data_downloader.iter_item_batches) so it never has to be fully in memory.
+    All batches are still loaded in a single transaction.
+
+    Args:
+    - content_hash: Hash of the whole snapshot (see data_input.fingerprint); when it matches
+      the last snapshot ingested for the server, the batches are not read at all
+    - force: Ingest every item even if its fingerprint is unchanged
+    - callback: Called with the number of items read so far after each batch; an exception
+      raised from it rolls the whole snapshot back
+    """
+    start_time = time.perf_counter()
+    stats = {"inserted": 0, "skipped": 0, "updated": 0, "added": 0, "unchanged": 0, "snapshot_unchanged": False,
+             "changed_item_ids": []}
+
+    last_snapshot = fingerprint_operations.get_snapshot_fingerprint(session, server_id) if content_hash and not force else None
+    if last_snapshot and last_snapshot.content_hash == content_hash:
+        stats["snapshot_unchanged"] = True
+        stats["unchanged"] = last_snapshot.item_count
+        stats["elapsed"] = time.perf_counter() - start_time
+        return stats
+
+    item_count = 0
+    try:
+        for batch in batches:
+            item_count += len(batch)
+            item_hashes = {item_data["ItemId"]: fingerprint_item(item_data) for item_data in batch}
+            stored_hashes = {} if force else fingerprint_operations.get_item_fingerprints(session, server_id, item_hashes.keys())
+
+            # Only items whose price fields changed since the last snapshot need to be written
+            changed = [item_data for item_data in batch if stored_hashes.get(item_data["ItemId"]) != item_hashes[item_data["ItemId"]]]
+            stats["unchanged"] += len(batch) - len(changed)
+            if callback:
+                callback(item_count)
+            if not changed:
+                continue
+
+            entries = [parse_item_data(item_data, server_id) for item_data in changed]
+
+            inserted, skipped = price_log_operations.bulk_add_price_log_entries(session, server_id, entries)
+            added, updated = current_price_operations.upsert_current_prices(session, server_id, entries)
+            fingerprint_operations.save_item_fingerprints(
+                session, server_id, {item_data["ItemId"]: item_hashes[item_data["ItemId"]] for item_data in changed}
+            )
+
+            stats["inserted"] += inserted
+            stats["skipped"] += skipped
+            stats["updated"] += updated
+            stats["added"] += added
+            stats["changed_item_ids"].extend(item_data["ItemId"] for item_data in changed)
+
+        if content_hash:
+            fingerprint_operations.save_snapshot_fingerprint(
+                session, server_id, content_hash, item_count, item_count - stats["unchanged"]
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        # The index already holds the rolled back prices
+        item_operations.invalidate_item_type_index(server_id)
+        raise
+
+    stats["elapsed"] = time.perf_counter() - start_time
+    return stats
@@ -0,0 +1,98 @@
+#data_input/price_history.py
+
+import json
+import struct
+import zlib
+import numpy as np
+
+# Numeric columns of a price_graph_data point, stored as float64 with NaN for missing values
+PRICE_COLUMNS = ("avg_price", "lowest_price", "avg_avail", "rolling_average")
+DATE_COLUMN = "date_only"
+
+# Magic, format version and header length in front of the compressed payload
+ENCODING_MAGIC = b"NWPH"
+ENCODING_VERSION = 1
+_PREFIX = struct.Struct("<4sBI")
+
+
+class PriceHistory:
+    """
+    A price history response of nwmarketprices as contiguous NumPy columns, in the order
+    of the response: dates as datetime64[D] and PRICE_COLUMNS as float64 arrays. Any other
+    top level keys are kept in header, and any other point fields in extra_columns, so
+    to_json() gives back the response it was built from.
+    """
+
+    def __init__(self, header, dates, columns, extra_columns=None):
+        self.header = header
+        self.dates = dates
+        self.avg_price = columns["avg_price"]
+        self.lowest_price = columns["lowest_price"]
+        self.avg_avail = columns["avg_avail"]
+        self.rolling_average = columns["rolling_average"]
+        self.extra_columns = extra_columns or {}
+
+    @property
+    def item_name(self):
+        return self.header.get("item_name")
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_json(cls, data):
+        """Builds a history from the decoded JSON of the price history endpoint."""
+        header = {key: value for key, value in data.items() if key != "price_graph_data"}
+        points = data.get("price_graph_data") or []
+
+        dates = np.array([point.get(DATE_COLUMN) for point in points], dtype="datetime64[D]")
+        columns = {
+            column: np.array([point.get(column) for point in points], dtype=np.float64)
+            for column in PRICE_COLUMNS
+        }
+        known = set(PRICE_COLUMNS) | {DATE_COLUMN}
+        extra_keys = sorted({key for point in points for key in point if key not in known})
+        extra_columns = {key: [point.get(key) for point in points] for key in extra_keys}
+        return cls(header, dates, columns, extra_columns)
+
+    def to_json(self):
+        """Returns the history in the shape of the price history endpoint."""
+        points = []
+        for index, date in enumerate(np.datetime_as_string(self.dates)):
+            point = {DATE_COLUMN: None if np.isnat(self.dates[index]) else str(date)}
+            for column in PRICE_COLUMNS:
+                value = getattr(self, column)[index]
+                point[column] = None if np.isnan(value) else value.item()
+            for key, values in self.extra_columns.items():
+                point[key] = values[index]
+            points.append(point)
+        return dict(self.header, price_graph_data=points)
+
+    def to_bytes(self):
+        """Encodes the history as a JSON header followed by the raw columns, zlib compressed."""
+        header = json.dumps({
+            "header": self.header,
+            "length": len(self),
+            "extra_columns": self.extra_columns,
+        }, separators=(",", ":")).encode("utf-8")
+        columns = [self.dates.astype("<i8")] + [getattr(self, column).astype("<f8") for column in PRICE_COLUMNS]
+        payload = header + b"".join(column.tobytes() for column in columns)
+        return _PREFIX.pack(ENCODING_MAGIC, ENCODING_VERSION, len(header)) + zlib.compress(payload, 6)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Decodes a history written by to_bytes, the columns are read-only views of the payload."""
+        magic, version, header_length = _PREFIX.unpack_from(blob)
+        if magic != ENCODING_MAGIC or version != ENCODING_VERSION:
+            raise ValueError("Not an encoded price history")
+        payload = zlib.decompress(blob[_PREFIX.size:])
+        meta = json.loads(payload[:header_length])
+
+        length = meta["length"]
+        offset = header_length
+        dates = np.frombuffer(payload, dtype="<i8", count=length, offset=offset).view("datetime64[D]")
+        columns = {}
+        for column in PRICE_COLUMNS:
+            offset += length * 8
+            columns[column] = np.frombuffer(payload, dtype="<f8", count=length, offset=offset)
+        return cls(meta["header"], dates, columns, meta["extra_columns"])
@@ -0,0 +1,129 @@
+#data_input/refresh.py
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from data_input.data_downloader import download_data_to_file, iter_item_batches
+from data_input.fingerprint import fingerprint_file
+from data_input.ingest_worker import IngestCancelled
+from data_input.json_parse import process_json_batches
+from data_input.snapshot_archive import archive_snapshot
+from database.init_db import DATABASE_DATA_DIR, load_json
+from database.operations.cache_operations import invalidate_cache
+
+# Upper bound on simultaneous downloads, to stay polite with nwmarketprices
+DEFAULT_MAX_WORKERS = 4
+
+
+def load_configured_servers():
+    """Returns the servers configured in database/data/servers.json."""
+    return load_json(os.path.join(DATABASE_DATA_DIR, 'servers.json'))
+
+
+def _download_server(server_id, filename):
+    """Downloads, fingerprints and archives the snapshot of one server. Runs on a worker thread."""
+    start_time = time.perf_counter()
+    filename = download_data_to_file(server_id, filename=filename)
+    content_hash = fingerprint_file(filename)
+    archive_snapshot(filename, server_id, content_hash)
+    return filename, content_hash, time.perf_counter() - start_time
+
+
+def _ingest_server(session, server_id, filename, content_hash, callback=None):
+    """Ingests a downloaded snapshot, reporting the number of items read after each batch."""
+    def report_batch(items_read):
+        if callback:
+            callback(f"Server {server_id}: {items_read} items read")
+
+    return process_json_batches(session, iter_item_batches(filename), server_id,
+                                content_hash=content_hash, callback=report_batch)
+
+
+def refresh_server(session, server_id, callback=None):
+    """
+    Downloads, archives and ingests the latest prices of one server, then drops the
+    cached price histories of the items that changed.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_id: ID of the server to refresh
+    - callback: Called with a progress message between stages and after each ingested batch
+
+    Returns:
+    - The ingest stats of process_json_batches, plus the download seconds and the
+      invalidate_cache counters under "cache"
+    """
+    if callback:
+        callback(f"Server {server_id}: downloading")
+    filename, content_hash, download_seconds = _download_server(server_id, f'download_{server_id}.json')
+
+    stats = _ingest_server(session, server_id, filename, content_hash, callback)
+    stats["download_seconds"] = download_seconds
+    stats["cache"] = invalidate_cache(session, {server_id: stats["changed_item_ids"]})
+    return stats
+
+
+def refresh_all_servers(session, servers=None, max_workers=DEFAULT_MAX_WORKERS, callback=None):
+    """
+    Downloads the latest prices of every configured server concurrently and ingests
+    them one at a time, in the order the downloads finish. The downloads run on a bounded
+    thread pool while the calling thread is the single writer to the database, so a full
+    refresh takes about as long as the slowest server plus the ingest work. Each server
+    is ingested in its own transaction.
+
+    Args:
+    - session: The SQLAlchemy session used by the writer
+    - servers: List of {"server_name", "server_id"} dictionaries, defaults to servers.json
+    - max_workers: Maximum number of simultaneous downloads
+    - callback: Called with a progress message as each server is downloaded and ingested
+
+    Returns:
+    - Dictionary of server_name to its timings, ingest stats or error, plus the invalidate_cache
+      counters and the total elapsed seconds
+    """
+    start_time = time.perf_counter()
+    servers = servers if servers is not None else load_configured_servers()
+    report = {"servers": {}, "elapsed": 0.0}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_download_server, server["server_id"], f'download_{server["server_id"]}.json'): server
+            for server in servers
+        }
+
+        try:
+            for future in as_completed(futures):
+                server = futures[future]
+                server_report = {"server_id": server["server_id"]}
+                report["servers"][server["server_name"]] = server_report
+
+                try:
+                    filename, content_hash, download_seconds = future.result()
+                except Exception as e:
+                    server_report["error"] = f"Download failed: {e}"
+                    continue
+                server_report["download_seconds"] = download_seconds
+                if callback:
+                    callback(f"{server['server_name']}: downloaded in {download_seconds:.2f}s")
+
+                ingest_start = time.perf_counter()
+                try:
+                    server_report["stats"] = _ingest_server(session, server["server_id"], filename, content_hash, callback)
+                except IngestCancelled:
+                    raise
+                except Exception as e:
+                    server_report["error"] = f"Ingest failed: {e}"
+                server_report["ingest_seconds"] = time.perf_counter() - ingest_start
+        except IngestCancelled:
+            # Don't wait for downloads nobody will ingest
+            for future in futures:
+                future.cancel()
+            raise
+
+    report["cache"] = invalidate_cache(session, {
+        server_report["server_id"]: server_report["stats"]["changed_item_ids"]
+        for server_report in report["servers"].values() if "stats" in server_report
+    })
+
+    report["elapsed"] = time.perf_counter() - start_time
+    return report
@@ -0,0 +1,162 @@
+#data_input/snapshot_archive.py
+
+"""
+Keeps every downloaded latest-prices snapshot as a gzip file, one per server per
+download, plus an index.json describing them, and rebuilds PriceLog and CurrentPrice
+from that archive.
+
+    python -m data_input.snapshot_archive list
+    python -m data_input.snapshot_archive replay [--server 49]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from config.database_config import SNAPSHOT_ARCHIVE_DIR
+from data_input.data_downloader import DEFAULT_BATCH_SIZE, iter_item_batches
+from data_input.fingerprint import fingerprint_file
+from data_input.json_parse import process_json_batches
+from database.operations import fingerprint_operations
+
+INDEX_FILENAME = 'index.json'
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+# The index is rewritten by concurrent downloads, see data_input/refresh.py
+_index_lock = threading.Lock()
+
+
+def load_index(archive_dir=SNAPSHOT_ARCHIVE_DIR):
+    """Returns the archive entries, oldest first."""
+    index_path = os.path.join(archive_dir, INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def _save_index(entries, archive_dir):
+    index_path = os.path.join(archive_dir, INDEX_FILENAME)
+    with open(f'{index_path}.part', 'w') as f:
+        json.dump(entries, f, indent=1)
+    os.replace(f'{index_path}.part', index_path)
+
+
+def archive_snapshot(filename, server_id, content_hash=None, archive_dir=SNAPSHOT_ARCHIVE_DIR):
+    """
+    Stores a gzip copy of a downloaded snapshot file and records it in the index.
+    A snapshot identical to the last one archived for the server is not stored again.
+
+    Returns:
+    - The index entry of the snapshot
+    """
+    content_hash = content_hash or fingerprint_file(filename)
+
+    with _index_lock:
+        entries = load_index(archive_dir)
+        server_entries = [entry for entry in entries if entry['server_id'] == str(server_id)]
+        if server_entries and server_entries[-1]['content_hash'] == content_hash:
+            return server_entries[-1]
+
+        server_dir = os.path.join(archive_dir, str(server_id))
+        os.makedirs(server_dir, exist_ok=True)
+
+        now = datetime.now()
+        name = f'{now.strftime(TIMESTAMP_FORMAT)}.json.gz'
+        counter = 1
+        while os.path.exists(os.path.join(server_dir, name)):
+            name = f'{now.strftime(TIMESTAMP_FORMAT)}_{counter}.json.gz'
+            counter += 1
+        path = os.path.join(server_dir, name)
+
+        with open(filename, 'rb') as source, gzip.open(path, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target)
+
+        entry = {
+            'server_id': str(server_id),
+            'timestamp': now.isoformat(timespec='seconds'),
+            'path': os.path.relpath(path, archive_dir),
+            'content_hash': content_hash,
+            'bytes': os.path.getsize(filename),
+            'compressed_bytes': os.path.getsize(path),
+        }
+        entries.append(entry)
+        _save_index(entries, archive_dir)
+    return entry
+
+
+def replay_archive(session, server_ids=None, archive_dir=SNAPSHOT_ARCHIVE_DIR, batch_size=DEFAULT_BATCH_SIZE, callback=None):
+    """
+    Rebuilds PriceLog and CurrentPrice from the archived snapshots, oldest first, so
+    CurrentPrice ends up holding the newest archived prices. Each snapshot is loaded
+    with the bulk ingest in its own transaction. Item fingerprints are reset first,
+    then each snapshot only writes the items that changed since the previous one.
+
+    Args:
+    - session: The SQLAlchemy session
+    - server_ids: Servers to replay, defaults to every server in the archive
+    - callback: Called with (index, total, entry, stats) after each snapshot
+
+    Returns:
+    - Dictionary with the number of snapshots replayed, summed ingest counts and elapsed seconds
+    """
+    start_time = time.perf_counter()
+    entries = load_index(archive_dir)
+    if server_ids is not None:
+        server_ids = {str(server_id) for server_id in server_ids}
+        entries = [entry for entry in entries if entry['server_id'] in server_ids]
+
+    for server_id in {entry['server_id'] for entry in entries}:
+        fingerprint_operations.clear_fingerprints(session, server_id)
+    session.commit()
+
+    totals = {'snapshots': 0, 'inserted': 0, 'skipped': 0, 'updated': 0, 'added': 0, 'unchanged': 0}
+    entries = sorted(entries, key=lambda entry: entry['timestamp'])
+    for index, entry in enumerate(entries):
+        with gzip.open(os.path.join(archive_dir, entry['path']), 'rt', encoding='utf-8') as f:
+            stats = process_json_batches(session, iter_item_batches(f, batch_size), entry['server_id'],
+                                         content_hash=entry['content_hash'])
+        totals['snapshots'] += 1
+        for key in ('inserted', 'skipped', 'updated', 'added', 'unchanged'):
+            totals[key] += stats[key]
+        if callback:
+            callback(index + 1, len(entries), entry, stats)
+
+    totals['elapsed'] = time.perf_counter() - start_time
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay the price snapshot archive")
+    parser.add_argument('command', choices=['list', 'replay'])
+    parser.add_argument('--server', action='append', help="Server ID to replay, can be repeated (default: all)")
+    parser.add_argument('--archive-dir', default=SNAPSHOT_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for entry in load_index(args.archive_dir):
+            print(f"{entry['server_id']:>6}  {entry['timestamp']}  {entry['compressed_bytes']:>10} bytes  {entry['path']}")
+        return
+
+    from sqlalchemy.orm import sessionmaker
+    from database.models import engine
+
+    session = sessionmaker(bind=engine)()
+    try:
+        def report(index, total, entry, stats):
+            print(f"[{index}/{total}] {entry['server_id']} {entry['timestamp']}: {stats['inserted']} logged, "
+                  f"{stats['unchanged']} unchanged in {stats['elapsed']:.2f}s")
+
+        totals = replay_archive(session, args.server, args.archive_dir, callback=report)
+        print(f"Replayed {totals['snapshots']} snapshots in {totals['elapsed']:.2f}s: {totals['inserted']} price logs, "
+              f"{totals['added']} current prices added, {totals['updated']} updated")
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,8 @@ from config.database_config import DATABASE_URI
 from database.models import (Base, Item, CraftingRecipe, RecipeReagent, TradeSkill,
                              Player, PlayerSkill, Transaction, Server, RecipeSkillRequirement, item_itemtype_association, ItemType)
 from sqlalchemy.orm import sessionmaker
+from database.migrations import upgrade_database
+from data_input.http_client import get_client
 import os
 import json
 
@@ -90,7 +92,7 @@ def load_items(session):
 
 def fetch_and_save_item_names():
     # Define the API endpoint and output file path
-    api_url = "https://nwmarketprices.com/api/confirmed_names/"
+    api_path = "/api/confirmed_names/"
     output_file_path = os.path.join(DATABASE_DATA_DIR, 'nw_marketprices_item_names.json')
     
     # Check if the file already exists
@@ -99,15 +101,15 @@ def fetch_and_save_item_names():
         return
 
     # Make a request to the API
-    response = requests.get(api_url)
-    
-    # Check if the request was successful
-    if response.status_code == 200:
-        with open(output_file_path, 'w') as file:
-            json.dump(response.json(), file)
-        print(f"Item names saved to {output_file_path}")
-    else:
-        print(f"Error fetching item names from {api_url}. HTTP Status Code: {response.status_code}")
+    try:
+        item_names = get_client().fetch_json("confirmed-names", api_path)
+    except requests.RequestException as e:
+        print(f"Error fetching item names from {api_path}: {e}")
+        return
+
+    with open(output_file_path, 'w') as file:
+        json.dump(item_names, file)
+    print(f"Item names saved to {output_file_path}")
 
 
 def load_crafting_categories(session):
@@ -207,6 +209,7 @@ def init_database():
     """Initialize the SQLite database with the required tables."""
     engine = create_engine(DATABASE_URI)
     Base.metadata.create_all(engine)
+    upgrade_database(engine)
     print("Database initialized successfully!")
 
     # Now, initiate a session and populate data after creating tables
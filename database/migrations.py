@@ -0,0 +1,111 @@
+#database/migrations.py
+
+from sqlalchemy import text
+
+# Base.metadata.create_all only creates missing tables, so every change to an existing
+# table is applied here as a numbered migration. The version reached is kept in SQLite's
+# user_version pragma, and each migration must also be a no-op on a freshly created database.
+
+
+def _add_price_indexes(connection):
+    # Drop duplicate price logs left by older versions so the unique index can be built
+    connection.execute(text("""
+        DELETE FROM price_logs
+        WHERE log_id NOT IN (
+            SELECT MIN(log_id) FROM price_logs
+            GROUP BY item_id, last_updated, server_id, price, availability
+        )
+    """))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_price_logs_dedup "
+        "ON price_logs (item_id, last_updated, server_id, price, availability)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_price_logs_server_updated ON price_logs (server_id, last_updated)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_current_prices_server ON current_prices (server_id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_api_cache_last_cached ON api_cache (last_cached)"
+    ))
+
+
+def _key_api_cache_by_server(connection):
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(api_cache)"))]
+    if 'server_id' in columns:
+        return
+    # Old entries don't say which server they came from, so the cache starts over
+    connection.execute(text("DROP TABLE IF EXISTS api_cache"))
+    connection.execute(text("""
+        CREATE TABLE api_cache (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            server_id VARCHAR NOT NULL,
+            item_id VARCHAR NOT NULL,
+            cached_data TEXT NOT NULL,
+            last_cached DATETIME
+        )
+    """))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX ux_api_cache_server_item ON api_cache (server_id, item_id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX ix_api_cache_last_cached ON api_cache (last_cached)"
+    ))
+
+
+def _store_api_cache_as_binary(connection):
+    column_types = {row[1]: row[2] for row in connection.execute(text("PRAGMA table_info(api_cache)"))}
+    if column_types.get('cached_data') == 'BLOB':
+        return
+    # Cached JSON text can't be read as encoded price histories, so the cache starts over
+    connection.execute(text("DROP TABLE IF EXISTS api_cache"))
+    connection.execute(text("""
+        CREATE TABLE api_cache (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            server_id VARCHAR NOT NULL,
+            item_id VARCHAR NOT NULL,
+            cached_data BLOB NOT NULL,
+            last_cached DATETIME
+        )
+    """))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX ux_api_cache_server_item ON api_cache (server_id, item_id)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX ix_api_cache_last_cached ON api_cache (last_cached)"
+    ))
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, "Add PriceLog, CurrentPrice and APICache indexes and enforce PriceLog dedup", _add_price_indexes),
+    (2, "Key APICache by server and item", _key_api_cache_by_server),
+    (3, "Store APICache price histories as compressed columns", _store_api_cache_as_binary),
+]
+
+
+def get_schema_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def upgrade_database(engine):
+    """
+    Applies every migration newer than the schema version of the database, each in its own transaction.
+    Returns:
+        - The schema version after the upgrade
+    """
+    with engine.connect() as connection:
+        version = get_schema_version(connection)
+
+    for migration_version, description, migrate in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        with engine.begin() as connection:
+            migrate(connection)
+            # PRAGMA does not accept bound parameters
+            connection.execute(text(f"PRAGMA user_version = {int(migration_version)}"))
+        print(f"Applied database migration {migration_version}: {description}")
+        version = migration_version
+
+    return version
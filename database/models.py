@@ -1,11 +1,12 @@
 #database/models.py
 
 from datetime import datetime
-from sqlalchemy import Table, create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Text
+from sqlalchemy import Table, create_engine, Column, Integer, String, Float, ForeignKey, DateTime, Text, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
 
 from config.database_config import DATABASE_URI
+from database.migrations import upgrade_database
 
 Base = declarative_base()
 # Define the association table for the many-to-many relationship between Item and ItemType
@@ -18,9 +19,15 @@ class APICache(Base):
     __tablename__ = 'api_cache'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    item_id = Column(String, unique=True, nullable=False)
-    cached_data = Column(Text, nullable=False) 
-    last_cached = Column(DateTime, default=datetime.utcnow())  
+    server_id = Column(String, nullable=False)
+    item_id = Column(String, nullable=False)
+    cached_data = Column(LargeBinary, nullable=False)  # PriceHistory.to_bytes()
+    last_cached = Column(DateTime, default=datetime.now)  
+
+    __table_args__ = (
+        Index('ux_api_cache_server_item', 'server_id', 'item_id', unique=True),
+        Index('ix_api_cache_last_cached', 'last_cached'),
+    )
 
 class ItemType(Base):
     __tablename__ = 'item_types'
@@ -66,6 +73,12 @@ class PriceLog(Base):
     server = relationship("Server", back_populates="price_logs")
     item = relationship("Item", back_populates="price_logs")
 
+    __table_args__ = (
+        # Enforces the duplicate check of add_price_log_entry and serves item/date range lookups
+        Index('ux_price_logs_dedup', 'item_id', 'last_updated', 'server_id', 'price', 'availability', unique=True),
+        Index('ix_price_logs_server_updated', 'server_id', 'last_updated'),
+    )
+
 
 class CurrentPrice(Base):
     __tablename__ = 'current_prices'
@@ -81,6 +94,27 @@ class CurrentPrice(Base):
     server = relationship("Server", back_populates="current_prices")
     item = relationship("Item", back_populates="current_price")
 
+    __table_args__ = (
+        Index('ix_current_prices_server', 'server_id'),
+    )
+
+
+class SnapshotFingerprint(Base):
+    __tablename__ = 'snapshot_fingerprints'
+
+    server_id = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    item_count = Column(Integer, nullable=False)
+    changed_count = Column(Integer, nullable=False)
+    last_ingested = Column(DateTime, nullable=False)
+
+
+class ItemFingerprint(Base):
+    __tablename__ = 'item_fingerprints'
+
+    item_id = Column(String, primary_key=True)
+    server_id = Column(String, primary_key=True)
+    item_hash = Column(String, nullable=False)
 
 
 class RecipeSkillRequirement(Base):
@@ -184,3 +218,4 @@ class Server(Base):
 # Create an engine and bind it to the Base
 engine = create_engine(DATABASE_URI)
 Base.metadata.create_all(engine)
+upgrade_database(engine)
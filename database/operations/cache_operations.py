@@ -1,66 +1,273 @@
-from database.models import APICache, engine
+from database.models import APICache, Item, engine
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from database.operations.item_operations import get_item_by_id
+from data_input.http_client import TokenBucket, get_client
+from data_input.price_history import PriceHistory
+from config.api_config import PRICE_HISTORY_BURST, PRICE_HISTORY_RATE, PRICE_HISTORY_WORKERS
+from config.cache_config import MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL, PRICE_HISTORY_TTL
+import threading
 import requests
 import time
-import json
 
 
 Session = sessionmaker(bind=engine)
 
-def get_cached_data(session, item_id):
+# Shared by every price history request of the process, prefetched or not
+history_rate_limiter = TokenBucket(PRICE_HISTORY_RATE, PRICE_HISTORY_BURST)
+
+# Item IDs per DELETE when invalidating changed items
+INVALIDATE_CHUNK_SIZE = 500
+
+
+class PriceHistoryMemoryCache:
+    """
+    Thread-safe LRU of PriceHistory objects keyed by (server_id, item_id), in front of
+    the api_cache table. Each entry remembers when it was cached in the table, so it expires
+    with the table entry, and when it was loaded, so it is re-read after MEMORY_CACHE_TTL.
+    """
+
+    def __init__(self, max_size=MEMORY_CACHE_SIZE, ttl=MEMORY_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = timedelta(seconds=min(ttl, PRICE_HISTORY_TTL))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            data, last_cached, loaded_at = entry
+            if not is_fresh(last_cached, now) or now - loaded_at >= self.ttl:
+                del self._entries[key]
+                self.stats["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return data
+
+    def put(self, key, data, last_cached, now):
+        with self._lock:
+            self._entries[key] = (data, last_cached, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+memory_cache = PriceHistoryMemoryCache()
+
+
+def is_fresh(last_cached, now):
+    return last_cached is not None and now - last_cached < timedelta(seconds=PRICE_HISTORY_TTL)
+
+
+def get_cache_stats():
+    """
+    Returns the hit, miss, eviction and expiry counters of the price history cache,
+    plus the number of histories currently held in memory.
+    """
+    with memory_cache._lock:
+        stats = dict(memory_cache.stats)
+    stats["memory_entries"] = len(memory_cache)
+    return stats
+
+
+def get_cached_data(session, item_id, server_id):
+    """
+    Looks a price history up in memory, then in the api_cache table.
+    Returns:
+        - The PriceHistory, or None if it isn't cached or no longer fresh
+    """
     current_time = datetime.now()
-    cached_data = session.query(APICache).filter_by(item_id=item_id).first()
+    key = (str(server_id), item_id)
+    data = memory_cache.get(key, current_time)
+    if data is not None:
+        return data
+
+    cached_data = session.query(APICache).filter_by(server_id=str(server_id), item_id=item_id).first()
+    if cached_data and is_fresh(cached_data.last_cached, current_time):
+        data = PriceHistory.from_bytes(cached_data.cached_data)
+        memory_cache.put(key, data, cached_data.last_cached, current_time)
+        memory_cache.count("disk_hits")
+        return data
 
-    if cached_data:
-        # If cached data is from today, return it
-        if cached_data.last_cached.date() == current_time.date():
-            return json.loads(cached_data.cached_data)
+    memory_cache.count("misses")
     return None
 
 
 def clear_cache(session):
     """
-    Clear all entries from the APICache table.
+    Clear all entries from the APICache table and the memory cache.
     """
     try:
         session.query(APICache).delete()
         session.commit()
+        memory_cache.clear()
         print("Cache cleared successfully!")
     except Exception as e:
         session.rollback()
         print(f"Error clearing cache: {e}")
 
 
-def update_cache(session, item_id, data):
-    serialized_data = json.dumps(data)
-    cached_data = session.query(APICache).filter_by(item_id=item_id).first()
+def invalidate_cache(session, changed_items):
+    """
+    Drops the cached price histories of the items whose current price changed, and every
+    entry past PRICE_HISTORY_TTL, keeping the rest of the cache.
+
+    Args:
+    - session: The SQLAlchemy session
+    - changed_items: Dictionary of server_id to the IDs of its items whose current price changed
+
+    Returns:
+    - Dictionary with the number of entries invalidated, expired and kept
+    """
+    stats = {"invalidated": 0, "expired": 0, "kept": 0}
+    try:
+        for server_id, item_ids in changed_items.items():
+            item_ids = list(set(item_ids))
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(item_ids), INVALIDATE_CHUNK_SIZE):
+                chunk = item_ids[start:start + INVALIDATE_CHUNK_SIZE]
+                stats["invalidated"] += session.query(APICache).filter(
+                    APICache.server_id == str(server_id), APICache.item_id.in_(chunk)
+                ).delete(synchronize_session=False)
+            memory_cache.discard((str(server_id), item_id) for item_id in item_ids)
+
+        expired_before = datetime.now() - timedelta(seconds=PRICE_HISTORY_TTL)
+        stats["expired"] = session.query(APICache).filter(
+            APICache.last_cached < expired_before
+        ).delete(synchronize_session=False)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    stats["kept"] = session.query(APICache).count()
+    print(f"Cache invalidated: {stats['invalidated']} changed and {stats['expired']} expired entries dropped, "
+          f"{stats['kept']} kept")
+    return stats
+
+
+def update_cache(session, item_id, server_id, data):
+    serialized_data = data.to_bytes()
+    current_time = datetime.now()
+    cached_data = session.query(APICache).filter_by(server_id=str(server_id), item_id=item_id).first()
 
     if not cached_data:
-        cached_data = APICache(item_id=item_id, cached_data=serialized_data)
+        cached_data = APICache(server_id=str(server_id), item_id=item_id, cached_data=serialized_data,
+                               last_cached=current_time)
         session.add(cached_data)
     else:
         cached_data.cached_data = serialized_data
-        cached_data.last_cached = datetime.now()
-    
+        cached_data.last_cached = current_time
+
     session.commit()
+    memory_cache.put((str(server_id), item_id), data, current_time, current_time)
 
 def fetch_data_from_api(nw_market_id, server_id):
-    url = f"https://nwmarketprices.com/0/{server_id}/?cn_id={nw_market_id}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
-    return None
+    try:
+        data = get_client().fetch_json("price-history", f"/0/{server_id}/?cn_id={nw_market_id}")
+    except (requests.RequestException, ValueError):
+        return None
+    return PriceHistory.from_json(data) if data else None
+
+def fetch_rate_limited(nw_market_id, server_id):
+    history_rate_limiter.acquire()
+    return fetch_data_from_api(nw_market_id, server_id)
+
+def prefetch_price_data(session, item_ids, server_id, max_workers=PRICE_HISTORY_WORKERS):
+    """
+    Fills the cache with the price history of every item that has no fresh entry for the server.
+    Misses are fetched concurrently, no faster than the shared rate limiter allows,
+    and written to the cache in a single commit.
+
+    Args:
+    - session: The SQLAlchemy session
+    - item_ids: Items that are about to be looked up with get_price_data
+    - server_id: ID of the server to fetch the history for
+    - max_workers: Maximum number of simultaneous requests
+
+    Returns:
+    - Dictionary with the number of items already cached, fetched, failed and the elapsed seconds
+    """
+    start_time = time.perf_counter()
+    item_ids = set(item_ids)
+    current_time = datetime.now()
+    stats = {"cached": 0, "fetched": 0, "failed": 0, "elapsed": 0.0}
+    if not item_ids:
+        return stats
+
+    cache_entries = {
+        entry.item_id: entry
+        for entry in session.query(APICache).filter(APICache.server_id == str(server_id),
+                                                    APICache.item_id.in_(list(item_ids)))
+    }
+    missing_ids = [item_id for item_id in item_ids
+                   if item_id not in cache_entries or not is_fresh(cache_entries[item_id].last_cached, current_time)]
+    stats["cached"] = len(item_ids) - len(missing_ids)
+
+    market_ids = dict(
+        session.query(Item.item_id, Item.nw_market_id)
+        .filter(Item.item_id.in_(missing_ids), Item.nw_market_id.isnot(None))
+    ) if missing_ids else {}
+    stats["failed"] = len(missing_ids) - len(market_ids)
+
+    if market_ids:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                item_id: executor.submit(fetch_rate_limited, nw_market_id, server_id)
+                for item_id, nw_market_id in market_ids.items()
+            }
+            results = {item_id: future.result() for item_id, future in futures.items()}
+
+        current_time = datetime.now()
+        fetched = {}
+        for item_id, data in results.items():
+            if data is None:
+                stats["failed"] += 1
+                continue
+            entry = cache_entries.get(item_id)
+            if entry is None:
+                session.add(APICache(server_id=str(server_id), item_id=item_id, cached_data=data.to_bytes(),
+                                     last_cached=current_time))
+            else:
+                entry.cached_data = data.to_bytes()
+                entry.last_cached = current_time
+            fetched[item_id] = data
+        session.commit()
+        stats["fetched"] = len(fetched)
+
+        for item_id, data in fetched.items():
+            memory_cache.put((str(server_id), item_id), data, current_time, current_time)
+
+    stats["elapsed"] = time.perf_counter() - start_time
+    return stats
 
 def get_price_data(session, item_id, server_id):
-    cached_data = get_cached_data(session, item_id)
-    if cached_data:
+    cached_data = get_cached_data(session, item_id, server_id)
+    if cached_data is not None:
         return cached_data
-    
-    last_query_time = session.query(APICache).with_entities(APICache.last_cached).order_by(APICache.last_cached.desc()).first()
-    if last_query_time and (datetime.now() - last_query_time[0]).total_seconds() < 1:
-        time.sleep(1)
 
     item = get_item_by_id(session, item_id)
     if not item:
@@ -68,9 +275,9 @@ def get_price_data(session, item_id, server_id):
         return None
 
     nw_market_id = item.nw_market_id
-    data_from_api = fetch_data_from_api(nw_market_id, server_id)
-    if data_from_api:
-        update_cache(session, item_id, data_from_api)
+    data_from_api = fetch_rate_limited(nw_market_id, server_id)
+    if data_from_api is not None:
+        update_cache(session, item_id, server_id, data_from_api)
         return data_from_api
 
     return None
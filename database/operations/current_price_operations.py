@@ -2,6 +2,8 @@
 
 from database.models import CraftingRecipe, CurrentPrice, Item, ItemType
 from sqlalchemy import func, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.operations.item_operations import update_item_type_prices
 
 
 def add_current_price(session, item_id, price_data):
@@ -23,6 +25,7 @@ def add_current_price(session, item_id, price_data):
         
     # Commit the session
     session.commit()
+    update_item_type_prices(server_id, {item_id: current_price.price})
 
 def update_current_price(session, item_id, new_price_data):
     """
@@ -49,6 +52,8 @@ def update_current_price(session, item_id, new_price_data):
         
         # Commit the session
         session.commit()
+        if "price" in new_price_data:
+            update_item_type_prices(current_price.server_id, {item_id: current_price.price})
     else:
         print(f"No current price entry found for item_id: {item_id} on server_id: {new_price_data.get('server_id')}")
 
@@ -138,3 +143,45 @@ def get_current_price(session, item_id, server_id):
     return None
 
 
+def upsert_current_prices(session, server_id, entries):
+    """
+    Inserts or updates the current price of many items on one server with a single
+    INSERT ... ON CONFLICT statement, and moves the items in the server's item type price
+    index. The caller owns the transaction; nothing is committed here, and a caller rolling
+    back should drop the index with item_operations.invalidate_item_type_index.
+    Args:
+        - session: The SQLAlchemy session
+        - server_id: ID of the server the entries belong to
+        - entries: List of dictionaries with item_id plus the CurrentPrice columns
+    Returns:
+        - Tuple of (inserted, updated) row counts
+    """
+    if not entries:
+        return 0, 0
+
+    # Keep only the last entry per item so the statement never hits the same row twice
+    latest = {entry["item_id"]: entry for entry in entries}
+
+    existing_ids = {
+        row.item_id for row in session.query(CurrentPrice.item_id).filter(
+            CurrentPrice.server_id == server_id,
+            CurrentPrice.item_id.in_(list(latest))
+        )
+    }
+    updated = sum(1 for item_id in latest if item_id in existing_ids)
+
+    statement = sqlite_insert(CurrentPrice.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["item_id", "server_id"],
+        set_={
+            "price": statement.excluded.price,
+            "availability": statement.excluded.availability,
+            "last_updated": statement.excluded.last_updated,
+            "highest_buy_order": statement.excluded.highest_buy_order,
+            "qty": statement.excluded.qty,
+        }
+    )
+    session.execute(statement, list(latest.values()))
+    update_item_type_prices(server_id, {item_id: entry.get("price") for item_id, entry in latest.items()})
+
+    return len(latest) - updated, updated
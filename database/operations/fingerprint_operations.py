@@ -0,0 +1,75 @@
+#database/operations/fingerprint_operations.py
+
+from datetime import datetime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database.models import ItemFingerprint, SnapshotFingerprint
+
+
+def get_snapshot_fingerprint(session, server_id):
+    """
+    Retrieves the fingerprint of the last snapshot ingested for a server.
+    Args:
+        - session: The SQLAlchemy session
+        - server_id: ID of the server
+    Returns:
+        - The SnapshotFingerprint entry, or None if no snapshot was ingested yet
+    """
+    return session.query(SnapshotFingerprint).filter(SnapshotFingerprint.server_id == str(server_id)).first()
+
+
+def save_snapshot_fingerprint(session, server_id, content_hash, item_count, changed_count):
+    """
+    Records the content hash of the snapshot just ingested for a server.
+    The caller owns the transaction; nothing is committed here.
+    """
+    fingerprint = get_snapshot_fingerprint(session, server_id)
+    if not fingerprint:
+        fingerprint = SnapshotFingerprint(server_id=str(server_id))
+        session.add(fingerprint)
+    fingerprint.content_hash = content_hash
+    fingerprint.item_count = item_count
+    fingerprint.changed_count = changed_count
+    fingerprint.last_ingested = datetime.now()
+
+
+def get_item_fingerprints(session, server_id, item_ids):
+    """
+    Retrieves the stored per-item hashes for the given items on a server.
+    Returns:
+        - Dictionary of item_id to item hash
+    """
+    rows = session.query(ItemFingerprint.item_id, ItemFingerprint.item_hash).filter(
+        ItemFingerprint.server_id == str(server_id),
+        ItemFingerprint.item_id.in_(list(item_ids))
+    )
+    return {row.item_id: row.item_hash for row in rows}
+
+
+def save_item_fingerprints(session, server_id, item_hashes):
+    """
+    Inserts or updates the per-item hashes of a server with a single upsert.
+    The caller owns the transaction; nothing is committed here.
+    Args:
+        - item_hashes: Dictionary of item_id to item hash
+    """
+    if not item_hashes:
+        return
+
+    statement = sqlite_insert(ItemFingerprint.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["item_id", "server_id"],
+        set_={"item_hash": statement.excluded.item_hash}
+    )
+    session.execute(statement, [
+        {"item_id": item_id, "server_id": str(server_id), "item_hash": item_hash}
+        for item_id, item_hash in item_hashes.items()
+    ])
+
+
+def clear_fingerprints(session, server_id):
+    """
+    Forgets every snapshot and item hash of a server, so the next ingest writes all items.
+    The caller owns the transaction; nothing is committed here.
+    """
+    session.query(ItemFingerprint).filter(ItemFingerprint.server_id == str(server_id)).delete()
+    session.query(SnapshotFingerprint).filter(SnapshotFingerprint.server_id == str(server_id)).delete()
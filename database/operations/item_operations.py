@@ -1,7 +1,121 @@
 #database/operations/item_operations.py
 
-from database.models import Item, item_itemtype_association
-import database.operations.current_price_operations as cpo
+from database.models import CurrentPrice, Item, item_itemtype_association
+import bisect
+import threading
+
+
+class ItemTypePriceIndex:
+    """
+    The members of every ItemType on one server, sorted by current price with unpriced
+    members last and ties in database order, so the cheapest member of a category is a
+    lookup. Built from two queries, then kept current by update_prices.
+    """
+
+    def __init__(self, server_id, memberships, prices):
+        """
+        Args:
+        - server_id: ID of the server the prices belong to
+        - memberships: (item_type_id, item_id) pairs in database order
+        - prices: Dictionary of item_id to its current price
+        """
+        self.server_id = server_id
+        self._prices = {item_id: price for item_id, price in prices.items() if price is not None}
+        self._positions = {}
+        self._types_of = {}
+        self._members = {}
+        for item_type_id, item_id in memberships:
+            if (item_type_id, item_id) in self._positions:
+                continue
+            self._positions[(item_type_id, item_id)] = len(self._positions)
+            self._types_of.setdefault(item_id, []).append(item_type_id)
+            self._members.setdefault(item_type_id, []).append(item_id)
+        for item_type_id, members in self._members.items():
+            members.sort(key=lambda item_id: self._sort_key(item_type_id, item_id))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, session, server_id):
+        memberships = session.query(item_itemtype_association.c.item_type_id, Item.item_id).join(
+            Item, Item.item_id == item_itemtype_association.c.item_id
+        ).all()
+        prices = dict(session.query(CurrentPrice.item_id, CurrentPrice.price).filter(CurrentPrice.server_id == server_id))
+        return cls(server_id, memberships, prices)
+
+    def _sort_key(self, item_type_id, item_id):
+        return self._prices.get(item_id, float('inf')), self._positions[(item_type_id, item_id)]
+
+    def item_type_ids(self):
+        """IDs of the item types with at least one member, in database order."""
+        with self._lock:
+            return list(self._members)
+
+    def members(self, item_type_id):
+        """Item IDs of the members of an item type, cheapest first."""
+        with self._lock:
+            return list(self._members.get(item_type_id, ()))
+
+    def cheapest_member(self, item_type_id, exclude=()):
+        """Item ID of the cheapest member of an item type not in exclude, None when there is none."""
+        with self._lock:
+            for item_id in self._members.get(item_type_id, ()):
+                if item_id not in exclude:
+                    return item_id
+        return None
+
+    def update_prices(self, prices):
+        """
+        Moves the items whose price changed to their new place in each of their item types.
+
+        Args:
+        - prices: Dictionary of item_id to its new current price, None when it has none
+        """
+        with self._lock:
+            for item_id, price in prices.items():
+                if self._prices.get(item_id) == price:
+                    continue
+                if price is None:
+                    self._prices.pop(item_id, None)
+                else:
+                    self._prices[item_id] = price
+                for item_type_id in self._types_of.get(item_id, ()):
+                    members = self._members[item_type_id]
+                    members.remove(item_id)
+                    bisect.insort(members, item_id, key=lambda member: self._sort_key(item_type_id, member))
+
+
+# ItemTypePriceIndex of each server, built on first use and kept current by upsert_current_prices
+_item_type_indexes = {}
+_item_type_indexes_lock = threading.Lock()
+
+
+def get_item_type_index(session, server_id):
+    """Returns the ItemTypePriceIndex of a server, loading it on first use."""
+    key = str(server_id)
+    with _item_type_indexes_lock:
+        index = _item_type_indexes.get(key)
+    if index is None:
+        index = ItemTypePriceIndex.load(session, server_id)
+        with _item_type_indexes_lock:
+            index = _item_type_indexes.setdefault(key, index)
+    return index
+
+
+def update_item_type_prices(server_id, prices):
+    """Applies new current prices ({item_id: price}) to the server's index, if it is loaded."""
+    with _item_type_indexes_lock:
+        index = _item_type_indexes.get(str(server_id))
+    if index is not None:
+        index.update_prices(prices)
+
+
+def invalidate_item_type_index(server_id=None):
+    """Drops the index of a server, or of every server when server_id is None."""
+    with _item_type_indexes_lock:
+        if server_id is None:
+            _item_type_indexes.clear()
+        else:
+            _item_type_indexes.pop(str(server_id), None)
 
 
 
@@ -34,10 +148,6 @@ def get_items_for_item_type(session, item_type_id, server_id):
     """
     Retrieves all items associated with a given item type, ordered by their market cost.
     """
-    items = session.query(Item).join(item_itemtype_association).filter(
-        item_itemtype_association.c.item_type_id == item_type_id
-    ).all()
-    # Fetch market prices and order by them. 
-    # Note: You'd need a function to get the price for each item.
-    items_sorted = sorted(items, key=lambda item: cpo.get_current_price(session, item.item_id, server_id)['price'] if cpo.get_current_price(session, item.item_id, server_id) else float('inf'))
-    return items_sorted
+    item_ids = get_item_type_index(session, server_id).members(item_type_id)
+    items = {item.item_id: item for item in session.query(Item).filter(Item.item_id.in_(item_ids))}
+    return [items[item_id] for item_id in item_ids if item_id in items]
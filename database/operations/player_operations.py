@@ -1,4 +1,80 @@
-from database.models import Player, PlayerSkill, RecipeSkillRequirement, TradeSkill, Server
+from database.models import CraftingRecipe, Player, PlayerSkill, RecipeSkillRequirement, TradeSkill, Server
+from sqlalchemy import and_, func
+import numpy as np
+import threading
+
+
+class CraftabilityIndex:
+    """
+    Which recipes one player can craft: craftable[i] tells whether the player meets every
+    skill requirement of recipe_ids[i], with recipe_ids in ascending order, the recipe
+    order of CraftingGraph.
+    """
+
+    def __init__(self, recipe_ids, craftable):
+        self.recipe_ids = recipe_ids
+        self.craftable = craftable
+
+    def can_craft(self, recipe_id):
+        position = int(np.searchsorted(self.recipe_ids, recipe_id))
+        if position < len(self.recipe_ids) and self.recipe_ids[position] == recipe_id:
+            return bool(self.craftable[position])
+        return True  # Unknown recipes have no requirements
+
+    def craftable_of(self, recipe_ids):
+        """Craftable flags in the order of recipe_ids, None when a recipe is missing from the index."""
+        if np.array_equal(recipe_ids, self.recipe_ids):
+            return self.craftable
+        positions = np.minimum(np.searchsorted(self.recipe_ids, recipe_ids), max(len(self.recipe_ids) - 1, 0))
+        if len(recipe_ids) and (not len(self.recipe_ids) or np.any(self.recipe_ids[positions] != recipe_ids)):
+            return None
+        return self.craftable[positions]
+
+
+# CraftabilityIndex of each player_id, built on first use and dropped when the player's skills change
+_craftability = {}
+_craftability_lock = threading.Lock()
+
+
+def build_craftability_index(session, player_id):
+    """
+    Builds the CraftabilityIndex of a player in one pass: a single query joins every
+    RecipeSkillRequirement with the player's PlayerSkill and returns the recipes with a
+    requirement the player does not meet.
+    """
+    recipe_ids = np.array(
+        [recipe_id for recipe_id, in session.query(CraftingRecipe.recipe_id).order_by(CraftingRecipe.recipe_id)],
+        dtype=np.int64
+    )
+    unmet = session.query(RecipeSkillRequirement.recipe_id).outerjoin(
+        PlayerSkill, and_(PlayerSkill.skill_id == RecipeSkillRequirement.skill_id, PlayerSkill.player_id == player_id)
+    ).filter(func.coalesce(PlayerSkill.skill_level, 0) < RecipeSkillRequirement.level_required).distinct()
+    unmet_ids = np.array([recipe_id for recipe_id, in unmet], dtype=np.int64)
+    return CraftabilityIndex(recipe_ids, ~np.isin(recipe_ids, unmet_ids))
+
+
+def get_craftability_index(session, player_id):
+    """
+    Returns the CraftabilityIndex of a player, built once and then kept in memory until
+    add_player, update_player or delete_player changes the player's skills.
+    """
+    with _craftability_lock:
+        index = _craftability.get(player_id)
+    if index is None:
+        index = build_craftability_index(session, player_id)
+        with _craftability_lock:
+            _craftability[player_id] = index
+    return index
+
+
+def invalidate_craftability(player_id=None):
+    """Drops the CraftabilityIndex of a player, or of every player when player_id is None."""
+    with _craftability_lock:
+        if player_id is None:
+            _craftability.clear()
+        else:
+            _craftability.pop(player_id, None)
+
 
 def add_player(session, player_data):
     # Retrieve the server
@@ -35,6 +111,7 @@ def add_player(session, player_data):
 
     # Commit the session to save everything
     session.commit()
+    invalidate_craftability(player.player_id)
 
 
 def update_player(session, player_id, new_data):
@@ -65,6 +142,8 @@ def update_player(session, player_id, new_data):
 
     # Commit the session
     session.commit()
+    if "skills" in new_data:
+        invalidate_craftability(player_id)
 
 def get_player_skills(session, player_id):
     """
@@ -88,20 +167,8 @@ def get_player_skills(session, player_id):
 
 
 def can_craft_recipe(session, player_id, recipe_id):
-    # Fetch the player's skills and skill levels
-    player_skills = {ps.skill_id: ps.skill_level for ps in session.query(PlayerSkill).filter(PlayerSkill.player_id == player_id)}
-
-    # Fetch the skill requirements for the recipe
-    recipe_skill_requirements = session.query(RecipeSkillRequirement).filter(RecipeSkillRequirement.recipe_id == recipe_id)
-
-    # Iterate through each skill requirement to check if the player has the required skill level
-    for req in recipe_skill_requirements:
-        player_skill_level = player_skills.get(req.skill_id, 0)
-        if player_skill_level < req.level_required:
-            return False  # Player does not meet the skill level requirement for crafting
-
-    # If all requirements are met
-    return True
+    # Look the recipe up in the player's craftability index, no query once it is built
+    return get_craftability_index(session, player_id).can_craft(recipe_id)
 
 
 def delete_player(session, player_id):
@@ -122,6 +189,7 @@ def delete_player(session, player_id):
 
     # Commit the session to finalize the deletion
     session.commit()
+    invalidate_craftability(player_id)
 
 
 def get_player_by_id(session, player_id):
@@ -1,6 +1,7 @@
 #database/operations/price_log_operations.py
 
 from sqlalchemy import and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from database.models import PriceLog
 
 def add_price_log_entry(session, item_id, log_data):
@@ -57,3 +58,51 @@ def get_price_log_entries(session, item_id, start_date=None, end_date=None):
     
     # Convert the result to a list of dictionaries
     return [entry.__dict__ for entry in query.all()]
+
+
+def bulk_add_price_log_entries(session, server_id, entries):
+    """
+    Adds many price log entries for one server in a single set-based pass.
+    Duplicates (same item, price, availability and last_updated) are resolved against
+    the existing rows with one query instead of one SELECT per entry. The caller owns
+    the transaction; nothing is committed here.
+    Args:
+        - session: The SQLAlchemy session
+        - server_id: ID of the server the entries belong to
+        - entries: List of dictionaries with item_id plus the PriceLog columns
+    Returns:
+        - Tuple of (inserted, skipped) row counts
+    """
+    if not entries:
+        return 0, 0
+
+    # Every duplicate of an incoming row is for one of the incoming items and at least as new as the oldest incoming row
+    oldest = min(entry["last_updated"] for entry in entries)
+    item_ids = list({entry["item_id"] for entry in entries})
+    existing_rows = session.query(
+        PriceLog.item_id, PriceLog.price, PriceLog.availability, PriceLog.last_updated
+    ).filter(
+        and_(
+            PriceLog.server_id == server_id,
+            PriceLog.item_id.in_(item_ids),
+            PriceLog.last_updated >= oldest
+        )
+    ).all()
+    seen = {(row.item_id, row.price, row.availability, row.last_updated) for row in existing_rows}
+
+    new_rows = []
+    for entry in entries:
+        key = (entry["item_id"], entry["price"], entry["availability"], entry["last_updated"])
+        if key in seen:
+            continue
+        seen.add(key)
+        new_rows.append(entry)
+
+    inserted = 0
+    if new_rows:
+        # The unique index on price_logs is the final guard against duplicates; the rows it
+        # drops are not in the rowcount
+        result = session.execute(sqlite_insert(PriceLog.__table__).on_conflict_do_nothing(), new_rows)
+        inserted = result.rowcount
+
+    return inserted, len(entries) - inserted
@@ -1,6 +1,7 @@
 # database/operations/recipe_operations.py
 
 from database.models import CraftingRecipe, ItemType, RecipeReagent, RecipeSkillRequirement, TradeSkill
+from database.operations.player_operations import invalidate_craftability
 
 
 def add_recipe(session, recipe_data):
@@ -36,6 +37,8 @@ def add_recipe(session, recipe_data):
                 session.add(reagent)
 
     session.commit()
+    # Craftability indexes list every recipe, a new one needs them rebuilt
+    invalidate_craftability()
 
 
 def get_recipe_by_id(session, recipe_id):
@@ -1,7 +1,9 @@
+import queue
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from analysis.crafting_profit import CraftingProfitAnalyzer
+from analysis.crafting_profit import CraftingProfitAnalyzer, stream_recipes_job
+from data_input.ingest_worker import IngestWorker
 from analysis.buy_profit import BuyProfitAnalyzer
 from database.operations.item_operations import get_item_by_id
 from ui.graph_frame import ItemGraphFrame
@@ -13,6 +15,9 @@ class AnalysisFrame(tk.Frame):
         self.data_store = data_store
         self.crafting_profit_analyzer = CraftingProfitAnalyzer(self.session, self.data_store.server_id, self.data_store.player_id)
         self.buy_profit_analyzer = BuyProfitAnalyzer(self.session, self.data_store.server_id, self.data_store.player_id)
+        self.recipe_worker = None
+        self.recipe_worker_stopped = False
+        self.recipe_evaluation_pending = False
         
         self.progress = ttk.Progressbar(self, orient="horizontal", length=200, mode="determinate")
         self.progress.grid(row=0, column=1, pady=(5,5))
@@ -66,25 +71,78 @@ class AnalysisFrame(tk.Frame):
         if not item_id:
             messagebox.showerror("Error", "Please enter an Item ID")
             return
-        info = self.profitability_info.get(item_id, {})
+        info = self.selected_info(item_id)
         result_text = f"Name: {get_item_by_id(self.session, item_id).item_name}\nProfit: {info.get('Profit', 'N/A')}\nCrafting Tree: {info.get('Crafting Tree', {})}"
         self.result_text.delete('1.0', tk.END)
         self.result_text.insert(tk.END, result_text)
         self.populate_tree(info.get("Crafting Tree", {}))
     
     def evaluate_all_recipes_ui(self):
-        self.profitability_info = self.crafting_profit_analyzer.evaluate_all_recipes(callback=self.update_progress)
+        # Rank on a background worker with its own session and show the best recipes as they
+        # come in; after the first evaluation only the recipes affected by new prices are
+        # evaluated again, and the previous top is shown before any history is looked up
+        if self.recipe_worker and self.recipe_worker.is_alive():
+            if self.recipe_worker_stopped:
+                # A stopped worker still owns the analyzer until its current batch is done
+                self.recipe_evaluation_pending = True
+            else:
+                print("A recipe evaluation is already running")
+            return
+        self.recipe_evaluation_pending = False
+        self.recipe_worker = IngestWorker(stream_recipes_job, self.crafting_profit_analyzer).start()
+        self.recipe_worker_stopped = False
+        self.after(100, self.poll_recipe_worker, self.recipe_worker)
+
+    def poll_recipe_worker(self, worker):
+        # Drain the events posted by the background worker
+        while True:
+            try:
+                event, payload = worker.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event == "progress":
+                kind, value = payload
+                if self.recipe_worker_stopped:
+                    continue  # The listbox shows something else now
+                if kind == "ranking":
+                    self.profitability_info = value
+                    self.show_results()
+                else:
+                    self.update_progress(*value)
+                continue
+
+            self.recipe_worker = None
+            if event == "error":
+                print(f"An error occurred while evaluating recipes: {payload}")
+            if self.recipe_evaluation_pending:
+                self.evaluate_all_recipes_ui()
+            return
 
-        self.listbox.delete(0, tk.END)  # Clear existing listbox items
-        for item_id in self.profitability_info:
-            self.listbox.insert(tk.END, item_id)
+        self.after(100, self.poll_recipe_worker, worker)
+
+    def stop_recipe_worker(self):
+        # The worker owns the analyzer until it has stopped, so it stays the running one until then
+        if self.recipe_worker is not None:
+            self.recipe_worker.cancel()
+            self.recipe_worker_stopped = True
+        self.recipe_evaluation_pending = False
     
     def evaluate_all_buy_prices_ui(self):
+        self.stop_recipe_worker()
         self.profitability_info = self.buy_profit_analyzer.evaluate_all_buy_prices()
+        self.show_results()
+
+    def show_results(self):
+        # Keep the selected item selected when the ranking is refined
+        selection = self.listbox.curselection()
+        selected_item_id = self.listbox.get(selection[0]) if selection else None
 
         self.listbox.delete(0, tk.END)  # Clear existing listbox items
-        for item_id in self.profitability_info:
+        for index, item_id in enumerate(self.profitability_info):
             self.listbox.insert(tk.END, item_id)
+            if item_id == selected_item_id:
+                self.listbox.selection_set(index)
 
     def update_progress(self, current, total):
         progress = (current / total) * 100
@@ -102,9 +160,18 @@ class AnalysisFrame(tk.Frame):
         self.price_graph_frame.plot_prices_for_item(item_id)
         self.display_item_info(item_id)
 
+    def selected_info(self, item_id):
+        # Crafting results only keep the root node of their crafting tree, the nested
+        # dictionaries the tree views and the shopping list read are built here
+        info = self.profitability_info.get(item_id, {})
+        crafting_tree = info.get("Crafting Tree")
+        if crafting_tree is not None and not isinstance(crafting_tree, dict):
+            info = dict(info, **{"Crafting Tree": crafting_tree.materialize()})
+        return info
+
     def display_item_info(self, item_id):
         # Lookup the item info from the stored profitability_info
-        info = self.profitability_info.get(item_id, {})
+        info = self.selected_info(item_id)
         self.data_store.selected_item_info = info
 
         item = get_item_by_id(self.session, item_id)
@@ -138,12 +205,12 @@ class AnalysisFrame(tk.Frame):
         # Populate the crafting tree if it exists
         crafting_tree = info.get("Crafting Tree")
         if crafting_tree:
-            self.populate_tree(crafting_tree, item_id)
+            self.populate_tree(crafting_tree)
 
 
 
 
-    def populate_tree(self, crafting_tree, root_item_id):
+    def populate_tree(self, crafting_tree):
         self.tree.delete(*self.tree.get_children())  # Clear existing tree items
         self._add_tree_children("", crafting_tree)  # Start with the root node of the crafting_tree
 
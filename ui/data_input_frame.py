@@ -1,11 +1,14 @@
+import queue
 import tkinter as tk
 from tkinter import ttk  # Themed Tkinter
-from data_input.json_parse import process_json_data
-from data_input.data_downloader import download_data, save_data_to_file, load_data_from_file
+from data_input.ingest_worker import IngestWorker
+from data_input.refresh import refresh_all_servers, refresh_server
+from analysis.cache_warming import warm_cache
 from database.models import Player, Server
 from database.init_db import init_database
+from database.operations.item_operations import invalidate_item_type_index
+from database.operations.player_operations import invalidate_craftability
 from ui.character_frame import CharacterFrame
-from database.operations.cache_operations import clear_cache
 
 
 class DataInputFrame(tk.Frame):
@@ -43,9 +46,24 @@ class DataInputFrame(tk.Frame):
         # Create a button for updating prices
         self.update_button = tk.Button(self, text="Update Prices", command=self.update_prices)
         self.update_button.grid(row=0, column=5, padx=5, pady=5)
+        # Create a button for updating the prices of every configured server
+        self.update_all_button = tk.Button(self, text="Update All Servers", command=self.update_all_prices)
+        self.update_all_button.grid(row=0, column=6, padx=5, pady=5)
         # Add button to open the CharacterFrame
         self.character_mgmt_button = ttk.Button(self, text="Manage Characters", command=self.open_character_frame)
-        self.character_mgmt_button.grid(row=0, column=6, padx=5, pady=5)
+        self.character_mgmt_button.grid(row=0, column=7, padx=5, pady=5)
+
+        # Button to cancel a running price update, and its progress
+        self.cancel_button = tk.Button(self, text="Cancel Update", command=self.cancel_update, state=tk.DISABLED)
+        self.cancel_button.grid(row=1, column=5, padx=5, pady=5)
+        self.status_var = tk.StringVar()
+        self.status_label = tk.Label(self, textvariable=self.status_var)
+        self.status_label.grid(row=1, column=6, columnspan=2, padx=5, pady=5, sticky='w')
+        # Prefetch the price histories the analyzers will need once an update finished
+        self.warm_cache_var = tk.BooleanVar(value=False)
+        self.warm_cache_check = tk.Checkbutton(self, text="Warm cache after update", variable=self.warm_cache_var)
+        self.warm_cache_check.grid(row=1, column=4, padx=5, pady=5)
+        self.worker = None
 
 
     def populate_character_dropdown(self):
@@ -85,6 +103,10 @@ class DataInputFrame(tk.Frame):
         try:
             init_database()
             print("Database initialized successfully.")
+
+            # Recipes and item types may have been added, drop what was derived from the old ones
+            invalidate_item_type_index()
+            invalidate_craftability()
             
             # Refresh the server and character dropdowns
             self.populate_server_dropdown()
@@ -106,18 +128,99 @@ class DataInputFrame(tk.Frame):
     def update_prices(self):
         # Get the selected server ID from the dropdown menu
         if self.data_store.server_id:
-            # Download the data
-            data = download_data(self.data_store.server_id)
-            # Save the data to download.json
-            save_data_to_file(data)
-            # Now process the downloaded data
-            process_json_data(self.session, data, self.data_store.server_id)
-            # Clear old API cache
-            clear_cache(self.session)
-            print("Prices pulled from NW Market Prices")
+            # Download and ingest on a background worker so the window stays responsive
+            self.start_worker(refresh_server, self.data_store.server_id, on_done=self.report_server_refresh)
         else:
             print(f"No server found with name {self.data_store.server_id}")
 
+    def update_all_prices(self):
+        # Download every server in servers.json concurrently and ingest them one by one
+        self.start_worker(refresh_all_servers, on_done=self.report_all_servers_refresh)
+
+    def start_worker(self, job, *args, on_done, status="Updating prices..."):
+        if self.worker and self.worker.is_alive():
+            print("A price update is already running")
+            return
+        self.worker = IngestWorker(job, *args).start()
+        self.worker_on_done = on_done
+        self.update_button.config(state=tk.DISABLED)
+        self.update_all_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status_var.set(status)
+        self.after(100, self.poll_worker)
+
+    def cancel_update(self):
+        if self.worker:
+            self.worker.cancel()
+            self.status_var.set("Cancelling...")
+
+    def poll_worker(self):
+        # Drain the events posted by the background worker
+        while True:
+            try:
+                event, payload = self.worker.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event == "progress":
+                self.status_var.set(payload)
+                continue
+
+            self.update_button.config(state=tk.NORMAL)
+            self.update_all_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.worker = None
+            if event == "done":
+                # The worker committed from its own session, drop anything this one has cached
+                self.session.expire_all()
+                self.status_var.set("Prices updated")
+                self.worker_on_done(payload)
+            elif event == "cancelled":
+                print("Price update cancelled")
+                self.status_var.set("Price update cancelled")
+            else:
+                print(f"An error occurred while updating prices: {payload}")
+                self.status_var.set("Price update failed")
+            return
+
+        self.after(100, self.poll_worker)
+
+    def report_server_refresh(self, stats):
+        if stats["snapshot_unchanged"]:
+            print(f"Prices unchanged since the last pull from NW Market Prices, {stats['unchanged']} items skipped")
+        else:
+            print(f"Prices pulled from NW Market Prices: {stats['inserted']} logged, {stats['skipped']} duplicates skipped, "
+                  f"{stats['updated']} prices updated, {stats['added']} prices added, {stats['unchanged']} unchanged items skipped "
+                  f"in {stats['elapsed']:.2f}s")
+        self.report_cache_invalidation(stats["cache"])
+        self.start_cache_warming()
+
+    def report_all_servers_refresh(self, report):
+        for server_name, server_report in report["servers"].items():
+            if "error" in server_report:
+                print(f"{server_name}: {server_report['error']}")
+                continue
+            stats = server_report["stats"]
+            print(f"{server_name}: downloaded in {server_report['download_seconds']:.2f}s, ingested in {server_report['ingest_seconds']:.2f}s "
+                  f"({stats['inserted']} logged, {stats['unchanged']} unchanged items skipped)")
+        print(f"All servers refreshed in {report['elapsed']:.2f}s")
+        self.report_cache_invalidation(report["cache"])
+        self.start_cache_warming()
+
+    def report_cache_invalidation(self, cache_stats):
+        self.status_var.set(f"Prices updated, {cache_stats['kept']} cached price histories kept")
+
+    def start_cache_warming(self):
+        # Warm the selected server only, that's the one the analysis tab looks at
+        if self.warm_cache_var.get() and self.data_store.server_id:
+            self.start_worker(warm_cache, self.data_store.server_id, on_done=self.report_cache_warming,
+                              status="Warming price history cache...")
+
+    def report_cache_warming(self, stats):
+        print(f"Price history cache warmed for {stats['items']} items: {stats['fetched']} fetched, "
+              f"{stats['cached']} already cached, {stats['failed']} failed in {stats['elapsed']:.2f}s")
+        self.status_var.set("Price history cache warmed")
+
     def on_server_select(self, event):
         # This method can be used to trigger actions when a server is selected from the dropdown
         selected_server_name = self.server_var.get()
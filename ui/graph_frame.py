@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.pyplot as plt
+import numpy as np
 from database.operations.cache_operations import get_price_data
 class ItemGraphFrame(ttk.Frame):
     def __init__(self, parent, session, data_store):
@@ -21,12 +22,12 @@ class ItemGraphFrame(ttk.Frame):
         if not data:
             return
 
-        # Extract data for plotting
-        dates = [entry['date_only'] for entry in data['price_graph_data']]
-        rolling_avg = [entry['rolling_average'] for entry in data['price_graph_data']]
-        avg_price = [entry['avg_price'] for entry in data['price_graph_data']]
-        lowest_price = [entry['lowest_price'] for entry in data['price_graph_data']]
-        avg_avail = [entry['avg_avail'] for entry in data['price_graph_data']]
+        # Extract data for plotting, dates as labels so every day gets an evenly spaced point
+        dates = np.datetime_as_string(data.dates)
+        rolling_avg = data.rolling_average
+        avg_price = data.avg_price
+        lowest_price = data.lowest_price
+        avg_avail = data.avg_avail
         
         fig, ax1 = plt.subplots(figsize=(10, 5))
 
@@ -53,7 +54,7 @@ class ItemGraphFrame(ttk.Frame):
         ax2.legend(loc='upper right')
 
         fig.autofmt_xdate()
-        fig.suptitle(data['item_name'])
+        fig.suptitle(data.item_name)
 
         # Clear previous canvas before adding a new one
         if hasattr(self, 'canvas'):